@@ -0,0 +1,93 @@
+"""Разреженные наборы полей `?fields=` для ответов API.
+
+Запрошенные поля превращаются в `values_list()`: в SELECT попадают
+только нужные колонки, а JOIN с авторами и группами появляется, лишь
+если запрошены их поля. Ответ собирается прямо из кортежей, без
+создания моделей.
+"""
+from posts.models import Post
+
+
+class Field:
+    """Поле ответа: путь в ORM и преобразование значения."""
+
+    def __init__(self, path, convert=None):
+        self.path = path
+        self.convert = convert
+
+
+def image_url(name):
+    if not name:
+        return None
+    return Post._meta.get_field('image').storage.url(name)
+
+
+def parse_fields(value, available):
+    """Имена полей из `?fields=`; ValueError для неизвестных."""
+    if not value:
+        return list(available)
+    names = list(dict.fromkeys(
+        name.strip() for name in value.split(',') if name.strip()
+    ))
+    unknown = [name for name in names if name not in available]
+    if unknown:
+        raise ValueError(
+            f'Неизвестные поля: {", ".join(unknown)}. '
+            f'Доступны: {", ".join(available)}'
+        )
+    return names
+
+
+class Fieldset:
+    """Поля ответа одного вида записей.
+
+    `keys` — поля курсора: они выбираются всегда и стоят в начале
+    каждой строки, даже если клиент их не запросил.
+    """
+
+    def __init__(self, fields, keys):
+        self.fields = fields
+        self.keys = keys
+
+    def parse(self, value):
+        return parse_fields(value, self.fields)
+
+    def select(self, queryset, names):
+        return queryset.values_list(
+            *self.keys, *(self.fields[name].path for name in names)
+        )
+
+    def serialize(self, rows, names):
+        offset = len(self.keys)
+        converters = [
+            (index, name, self.fields[name].convert)
+            for index, name in enumerate(names, offset)
+        ]
+        return [
+            {
+                name: convert(row[index]) if convert else row[index]
+                for index, name, convert in converters
+            }
+            for row in rows
+        ]
+
+
+POST_FIELDS = Fieldset({
+    'id': Field('id'),
+    'text': Field('text'),
+    'pub_date': Field('pub_date'),
+    'author': Field('author__username'),
+    'group': Field('group__slug'),
+    'image': Field('image', image_url),
+    'image_width': Field('image_width'),
+    'image_height': Field('image_height'),
+    'comments_count': Field('comments_count'),
+}, keys=('pub_date', 'id'))
+
+COMMENT_FIELDS = Fieldset({
+    'id': Field('id'),
+    'post': Field('post_id'),
+    'author': Field('author__username'),
+    'text': Field('text'),
+    'created': Field('created'),
+}, keys=('created', 'id'))
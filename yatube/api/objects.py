@@ -0,0 +1,109 @@
+"""Кэш представлений постов для API, общий для всех клиентов.
+
+Ключ включает `Post.version`, как у карточек постов (см.
+`posts.templatetags.post_cards`): изменение поста, его группы, автора,
+комментариев или готовность вариантов картинки дают новый ключ, а
+устаревшие записи просто перестают запрашиваться.
+
+Пост, у которого вместо миниатюры отдаётся исходная картинка, версию
+не меняет, когда миниатюру создаст тег `thumbnail`, поэтому такие
+представления хранятся недолго.
+"""
+from django.core.cache import cache
+
+from posts.models import Post, PostImageVariant
+from posts.thumbnails import (FALLBACK_GEOMETRY, FALLBACK_OPTIONS,
+                              pending_names, resolve_thumbnails)
+
+from .fields import POST_FIELDS, image_url
+
+OBJECT_TIMEOUT = 60 * 60 * 24
+FALLBACK_TIMEOUT = 60
+OBJECT_FIELDS = (*POST_FIELDS.fields, 'thumbnail')
+
+
+def object_key(pk, version):
+    return f'api:post:{pk}:{version}'
+
+
+def post_objects(ids):
+    """Представления постов `ids` по id; несуществующих в словаре нет.
+
+    Версии читаются одним запросом, готовые представления — одним
+    `get_many`, недостающие собираются `build_objects`.
+    """
+    versions = dict(
+        Post.objects.filter(pk__in=ids).values_list('pk', 'version')
+    )
+    keys = {object_key(pk, version): pk for pk, version in versions.items()}
+    objects = {
+        keys[key]: value for key, value in cache.get_many(list(keys)).items()
+    }
+    missing = [pk for pk in versions if pk not in objects]
+    if missing:
+        # Пост мог измениться после чтения версии: более новые данные
+        # под старым ключом безвредны, его больше не запросят.
+        built, fallbacks = build_objects(missing)
+        for timeout, pks in (
+            (OBJECT_TIMEOUT, built.keys() - fallbacks),
+            (FALLBACK_TIMEOUT, fallbacks),
+        ):
+            cache.set_many({
+                object_key(pk, versions[pk]): built[pk] for pk in pks
+            }, timeout)
+        objects.update(built)
+    return objects
+
+
+def build_objects(ids):
+    """Представления постов одним запросом с автором и группой.
+
+    Вместе с ними возвращает id постов, у которых вместо миниатюры
+    исходная картинка.
+    """
+    names = list(POST_FIELDS.fields)
+    rows = list(POST_FIELDS.select(Post.objects.filter(pk__in=ids), names))
+    pk = POST_FIELDS.keys.index('id')
+    image = len(POST_FIELDS.keys) + names.index('image')
+    images = {row[pk]: row[image] for row in rows if row[image]}
+    thumbnails, fallbacks = image_thumbnails(images)
+    objects = {}
+    for row, value in zip(rows, POST_FIELDS.serialize(rows, names)):
+        value['thumbnail'] = thumbnails.get(row[pk])
+        objects[row[pk]] = value
+    return objects, fallbacks
+
+
+def image_thumbnails(images):
+    """Адреса уменьшенных картинок для словаря id поста → имя файла.
+
+    Самый широкий JPEG-вариант, иначе готовая миниатюра sorl-thumbnail,
+    иначе исходная картинка; все они находятся за постоянное число
+    запросов. Вторым значением возвращает id постов с исходной
+    картинкой.
+    """
+    thumbnails = dict(PostImageVariant.objects.filter(
+        post_id__in=images, format=PostImageVariant.JPEG
+    ).order_by('post_id', 'width').values_list('post_id', 'image'))
+    storage = PostImageVariant._meta.get_field('image').storage
+    thumbnails = {pk: storage.url(name) for pk, name in thumbnails.items()}
+    without = {
+        pk: name for pk, name in images.items() if pk not in thumbnails
+    }
+    pending = pending_names(without.values())
+    field = Post._meta.get_field('image')
+    ready = resolve_thumbnails(
+        [
+            field.attr_class(None, field, name)
+            for name in set(without.values()) - pending
+        ],
+        FALLBACK_GEOMETRY, **FALLBACK_OPTIONS
+    )
+    fallbacks = set()
+    for pk, name in without.items():
+        if name in ready:
+            thumbnails[pk] = ready[name].url
+        else:
+            thumbnails[pk] = image_url(name)
+            fallbacks.add(pk)
+    return thumbnails, fallbacks
@@ -0,0 +1,259 @@
+# api/tests.py
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from api.objects import FALLBACK_TIMEOUT, OBJECT_TIMEOUT, object_key
+from posts.cache import get_generation
+from posts.models import Comment, Group, Post, PostImageVariant
+
+User = get_user_model()
+
+
+class PostsApiTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание'
+        )
+        cls.posts = [
+            Post.objects.create(
+                author=cls.author, text=f'Пост {number}',
+                group=cls.group if number % 2 else None,
+            )
+            for number in range(5)
+        ]
+        Comment.objects.create(
+            post=cls.posts[0], author=cls.author, text='Комментарий'
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+
+    def test_posts_paginated_by_cursor(self):
+        """Посты отдаются страницами по курсору, новые первыми"""
+        url = reverse('api:posts')
+        first = self.client.get(url, {'limit': 3}).json()
+        self.assertEqual(
+            [post['id'] for post in first['results']],
+            [post.pk for post in self.posts[:-4:-1]],
+        )
+        self.assertIsNone(first['previous'])
+        second = self.client.get(first['next']).json()
+        self.assertEqual(
+            [post['id'] for post in second['results']],
+            [self.posts[1].pk, self.posts[0].pk],
+        )
+        self.assertIsNone(second['next'])
+        post = second['results'][-1]
+        self.assertEqual(post['author'], 'author')
+        self.assertIsNone(post['group'])
+        self.assertIsNone(post['image'])
+
+    def test_sparse_fieldset(self):
+        """`?fields=` выбирает только запрошенные колонки"""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                reverse('api:posts'), {'fields': 'id,text'}
+            )
+        self.assertEqual(
+            set(response.json()['results'][0]), {'id', 'text'}
+        )
+        sql = queries.captured_queries[-1]['sql']
+        self.assertNotIn('auth_user', sql)
+        self.assertNotIn('comments_count', sql)
+
+    def test_invalid_parameters(self):
+        """Неизвестные поля и неверный limit дают ошибку 400"""
+        url = reverse('api:posts')
+        self.assertEqual(
+            self.client.get(url, {'fields': 'id,password'}).status_code, 400
+        )
+        self.assertEqual(self.client.get(url, {'limit': 0}).status_code, 400)
+
+    def test_group_and_profile_posts(self):
+        """Посты группы и автора, 404 для несуществующих"""
+        response = self.client.get(
+            reverse('api:group_posts', args=['group'])
+        )
+        self.assertEqual(
+            {post['group'] for post in response.json()['results']}, {'group'}
+        )
+        self.assertEqual(len(response.json()['results']), 2)
+        response = self.client.get(
+            reverse('api:profile_posts', args=['author'])
+        )
+        self.assertEqual(len(response.json()['results']), 5)
+        for url in (
+            reverse('api:group_posts', args=['missing']),
+            reverse('api:profile_posts', args=['missing']),
+            reverse('api:post_comments', args=[0]),
+        ):
+            self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_post_comments(self):
+        """Комментарии поста отдаются с его версией в ETag"""
+        url = reverse('api:post_comments', args=[self.posts[0].pk])
+        response = self.client.get(url)
+        self.assertEqual(response.json()['results'][0]['text'], 'Комментарий')
+        etag = response['ETag']
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304
+        )
+        Comment.objects.create(
+            post=self.posts[0], author=self.author, text='Ещё'
+        )
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200
+        )
+
+    def test_conditional_get(self):
+        """Неизменившийся список отдаётся ответом 304"""
+        url = reverse('api:posts')
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_comment_changes_list_etag(self):
+        """Новый комментарий меняет ETag списков с числом комментариев"""
+        urls = (
+            reverse('api:posts'),
+            reverse('api:group_posts', args=[self.group.slug]),
+            reverse('api:profile_posts', args=[self.author.username]),
+        )
+        etags = {url: self.client.get(url)['ETag'] for url in urls}
+        generation = get_generation()
+        Comment.objects.create(
+            post=self.posts[1], author=self.author, text='Новый'
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.client.get(
+                    url, HTTP_IF_NONE_MATCH=etags[url]
+                )
+                self.assertEqual(response.status_code, 200)
+                counts = {
+                    post['id']: post['comments_count']
+                    for post in response.json()['results']
+                }
+                self.assertEqual(counts[self.posts[1].pk], 1)
+        # Страницы сайта числа комментариев не показывают.
+        self.assertEqual(get_generation(), generation)
+
+
+class PostsBatchApiTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание'
+        )
+        cls.plain = Post.objects.create(author=cls.author, text='Без картинки')
+        cls.with_variants = Post.objects.create(
+            author=cls.author, text='С вариантами', group=cls.group
+        )
+        cls.original = Post.objects.create(author=cls.author, text='Картинка')
+        Post.objects.filter(
+            pk__in=[cls.with_variants.pk, cls.original.pk]
+        ).update(image='posts/meme.gif')
+        for width in (320, 960):
+            PostImageVariant.objects.create(
+                post=cls.with_variants, format=PostImageVariant.JPEG,
+                width=width, height=width // 3,
+                image=f'posts/variants/meme-{width}.jpg',
+            )
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.url = reverse('api:posts_batch')
+
+    def batch(self, ids, **params):
+        return self.client.get(self.url, {'ids': ids, **params})
+
+    def test_items_in_request_order(self):
+        """Посты отдаются в порядке id, ошибки — для каждого id"""
+        ids = f'{self.original.pk},999,abc,{self.plain.pk},{self.plain.pk}'
+        results = self.batch(ids).json()['results']
+        self.assertEqual(
+            [(item['id'], item['status']) for item in results],
+            [(self.original.pk, 200), (999, 404), ('abc', 400),
+             (self.plain.pk, 200)],
+        )
+        self.assertEqual(results[3]['post']['text'], 'Без картинки')
+
+    def test_invalid_ids(self):
+        """Id, которых не может быть в базе, дают ошибку 400 по каждому"""
+        tokens = ['²', '0', '-1', str(2 ** 63), '9' * 23]
+        response = self.batch(','.join([*tokens, str(self.plain.pk)]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(item['id'], item['status']) for item in response.json()[
+                'results'
+            ]],
+            [*((token, 400) for token in tokens), (self.plain.pk, 200)],
+        )
+
+    def test_thumbnails_resolved(self):
+        """Миниатюра — самый широкий вариант или исходная картинка"""
+        ids = f'{self.plain.pk},{self.with_variants.pk},{self.original.pk}'
+        posts = [
+            item['post']
+            for item in self.batch(ids, fields='thumbnail,group').json()[
+                'results'
+            ]
+        ]
+        self.assertEqual(posts[0], {'thumbnail': None, 'group': None})
+        self.assertEqual(
+            posts[1]['thumbnail'], '/media/posts/variants/meme-960.jpg'
+        )
+        self.assertEqual(posts[1]['group'], 'group')
+        self.assertEqual(posts[2]['thumbnail'], '/media/posts/meme.gif')
+
+    def test_fallback_thumbnail_cached_briefly(self):
+        """Представление с исходной картинкой хранится недолго"""
+        ids = f'{self.with_variants.pk},{self.original.pk}'
+        with mock.patch('api.objects.cache.set_many') as set_many:
+            self.batch(ids)
+        versions = dict(Post.objects.values_list('pk', 'version'))
+        timeouts = {
+            tuple(values): timeout
+            for (values, timeout), _ in set_many.call_args_list if values
+        }
+        self.assertEqual(timeouts, {
+            (object_key(pk, versions[pk]),): timeout
+            for pk, timeout in (
+                (self.with_variants.pk, OBJECT_TIMEOUT),
+                (self.original.pk, FALLBACK_TIMEOUT),
+            )
+        })
+
+    def test_served_from_object_cache(self):
+        """Повторный запрос читает из базы только версии постов"""
+        ids = f'{self.plain.pk},{self.with_variants.pk}'
+        self.batch(ids)
+        with self.assertNumQueries(1):
+            self.batch(ids)
+        self.plain.text = 'Изменённый'
+        self.plain.save()
+        results = self.batch(ids).json()['results']
+        self.assertEqual(results[0]['post']['text'], 'Изменённый')
+
+    def test_invalid_requests(self):
+        """Пустой или слишком длинный список id даёт ошибку 400"""
+        self.assertEqual(self.batch('').status_code, 400)
+        ids = ','.join(str(pk) for pk in range(1, 202))
+        self.assertEqual(self.batch(ids).status_code, 400)
+        self.assertEqual(
+            self.batch(str(self.plain.pk), fields='secret').status_code, 400
+        )
@@ -0,0 +1,166 @@
+from django.http import JsonResponse
+from django.views.decorators.http import condition, require_safe
+
+from posts.cache import comments_list_etag
+from posts.models import Comment, Group, Post, User
+from posts.paginators import CursorPaginator, encode_cursor
+from posts.views import post_etag
+
+from .fields import COMMENT_FIELDS, POST_FIELDS, parse_fields
+from .objects import OBJECT_FIELDS, post_objects
+
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+MAX_BATCH_SIZE = 200
+# Больше не помещается в столбец id SQLite.
+MAX_POST_ID = 2 ** 63 - 1
+JSON_PARAMS = {'ensure_ascii': False}
+
+
+class ValuesCursorPaginator(CursorPaginator):
+    """`CursorPaginator` для строк `values_list`, начинающихся с ключей."""
+
+    def encode(self, row):
+        return encode_cursor(row[0], row[1])
+
+
+def error(message, status):
+    return JsonResponse(
+        {'error': message}, status=status, json_dumps_params=JSON_PARAMS
+    )
+
+
+def page_size(request):
+    value = request.GET.get('limit')
+    if value is None:
+        return PAGE_SIZE
+    try:
+        limit = int(value)
+    except ValueError:
+        limit = 0
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise ValueError(f'limit должен быть от 1 до {MAX_PAGE_SIZE}')
+    return limit
+
+
+def parse_id(token):
+    """id поста из `token` или None, если такого id быть не может."""
+    try:
+        pk = int(token)
+    except ValueError:
+        return None
+    return pk if 0 < pk <= MAX_POST_ID else None
+
+
+def page_link(request, param, cursor):
+    if cursor is None:
+        return None
+    query = request.GET.copy()
+    query.pop('after', None)
+    query.pop('before', None)
+    query[param] = cursor
+    return f'{request.path}?{query.urlencode()}'
+
+
+def paginated(request, queryset, fieldset):
+    """Страница записей по курсору с полями из `?fields=`."""
+    try:
+        names = fieldset.parse(request.GET.get('fields'))
+        limit = page_size(request)
+    except ValueError as exc:
+        return error(str(exc), 400)
+    paginator = ValuesCursorPaginator(
+        fieldset.select(queryset, names), limit, fieldset.keys
+    )
+    page = paginator.cursor_page(
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+    )
+    return JsonResponse({
+        'results': fieldset.serialize(page, names),
+        'next': page_link(request, 'after', page.next_cursor),
+        'previous': page_link(request, 'before', page.previous_cursor),
+    }, json_dumps_params=JSON_PARAMS)
+
+
+@require_safe
+@condition(etag_func=comments_list_etag)
+def posts(request):
+    return paginated(request, Post.objects.all(), POST_FIELDS)
+
+
+@require_safe
+@condition(etag_func=comments_list_etag)
+def group_posts(request, slug):
+    group_id = Group.objects.filter(slug=slug).values_list(
+        'pk', flat=True
+    ).first()
+    if group_id is None:
+        return error('Группа не найдена', 404)
+    return paginated(
+        request, Post.objects.filter(group_id=group_id), POST_FIELDS
+    )
+
+
+@require_safe
+@condition(etag_func=comments_list_etag)
+def profile_posts(request, username):
+    author_id = User.objects.filter(username=username).values_list(
+        'pk', flat=True
+    ).first()
+    if author_id is None:
+        return error('Автор не найден', 404)
+    return paginated(
+        request, Post.objects.filter(author_id=author_id), POST_FIELDS
+    )
+
+
+@require_safe
+@condition(etag_func=post_etag)
+def post_comments(request, post_id):
+    if not Post.objects.filter(pk=post_id).exists():
+        return error('Пост не найден', 404)
+    return paginated(
+        request, Comment.objects.filter(post_id=post_id), COMMENT_FIELDS
+    )
+
+
+@require_safe
+def posts_batch(request):
+    """Посты из `?ids=` в порядке запроса, ошибки — по каждому id."""
+    try:
+        names = parse_fields(request.GET.get('fields'), OBJECT_FIELDS)
+    except ValueError as exc:
+        return error(str(exc), 400)
+    tokens = list(dict.fromkeys(
+        token.strip() for token in request.GET.get('ids', '').split(',')
+        if token.strip()
+    ))
+    if not tokens:
+        return error('Укажите id постов в ids через запятую', 400)
+    if len(tokens) > MAX_BATCH_SIZE:
+        return error(f'Не больше {MAX_BATCH_SIZE} id за запрос', 400)
+    ids = {}
+    for token in tokens:
+        pk = parse_id(token)
+        if pk is not None:
+            ids[token] = pk
+    objects = post_objects(set(ids.values()))
+    results = []
+    for token in tokens:
+        if token not in ids:
+            results.append(
+                {'id': token, 'status': 400, 'error': 'Неверный id'}
+            )
+        elif ids[token] not in objects:
+            results.append(
+                {'id': ids[token], 'status': 404, 'error': 'Пост не найден'}
+            )
+        else:
+            post = objects[ids[token]]
+            results.append({
+                'id': ids[token],
+                'status': 200,
+                'post': {name: post[name] for name in names},
+            })
+    return JsonResponse({'results': results}, json_dumps_params=JSON_PARAMS)
@@ -0,0 +1,320 @@
+"""Кэш в файле SQLite в режиме WAL, общий для всех процессов сервера.
+
+В отличие от `LocMemCache` запись, сделанная одним процессом, сразу
+видна остальным, поэтому сброс поколения страниц доходит до всех
+воркеров. Размер ограничен `MAX_ENTRIES` и `MAX_SIZE` (в байтах),
+при превышении удаляются давно не читавшиеся записи (LRU).
+
+    CACHES = {
+        'default': {
+            'BACKEND': 'core.cache.SQLiteCache',
+            'LOCATION': '/var/tmp/yatube-cache.sqlite3',
+            'OPTIONS': {'MAX_ENTRIES': 100000, 'MAX_SIZE': 256 * 2 ** 20},
+        }
+    }
+"""
+import math
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+SCHEMA_SQL = (
+    """CREATE TABLE IF NOT EXISTS cache (
+        key TEXT PRIMARY KEY,
+        value BLOB NOT NULL,
+        expires REAL,
+        accessed REAL NOT NULL,
+        size INTEGER NOT NULL
+    ) WITHOUT ROWID""",
+    'CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)',
+    'CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires)',
+    # Число и объём записей ведут триггеры, чтобы проверка лимитов
+    # после записи не просматривала всю таблицу.
+    """CREATE TABLE IF NOT EXISTS cache_stats (
+        id INTEGER PRIMARY KEY CHECK (id = 0),
+        entries INTEGER NOT NULL,
+        bytes INTEGER NOT NULL
+    )""",
+    'INSERT OR IGNORE INTO cache_stats VALUES (0, 0, 0)',
+    """CREATE TRIGGER IF NOT EXISTS cache_insert AFTER INSERT ON cache
+    BEGIN
+        UPDATE cache_stats
+        SET entries = entries + 1, bytes = bytes + new.size;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS cache_delete AFTER DELETE ON cache
+    BEGIN
+        UPDATE cache_stats
+        SET entries = entries - 1, bytes = bytes - old.size;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS cache_update AFTER UPDATE OF size ON cache
+    BEGIN
+        UPDATE cache_stats SET bytes = bytes - old.size + new.size;
+    END""",
+)
+PRAGMAS = (
+    'PRAGMA journal_mode = WAL',
+    'PRAGMA synchronous = NORMAL',
+    'PRAGMA busy_timeout = 5000',
+)
+UPSERT_SQL = (
+    'INSERT INTO cache (key, value, expires, accessed, size) '
+    'VALUES (?, ?, ?, ?, ?) '
+    'ON CONFLICT (key) DO UPDATE SET value = excluded.value, '
+    'expires = excluded.expires, accessed = excluded.accessed, '
+    'size = excluded.size'
+)
+# Не больше параметров в одном запросе, чем позволяют старые SQLite.
+MAX_VARIABLES = 500
+# Записи вытесняются с запасом, чтобы не чистить кэш на каждой записи.
+CULL_TARGET = 0.9
+# Сколько отметок о чтении копится в памяти до следующей записи.
+MAX_PENDING_TOUCHES = 10000
+
+
+class SQLiteCache(BaseCache):
+    """Кэш Django в файле SQLite, общий для процессов одной машины.
+
+    Целые числа хранятся как INTEGER, поэтому `incr` прибавляет
+    значение одним UPDATE без распаковки. Время последнего чтения
+    запоминается в памяти (не чаще, чем раз в `ACCESS_RESOLUTION`
+    секунд на ключ) и записывается в той же транзакции, что и
+    следующая запись в кэш, перед вытеснением: чтение никогда не
+    становится транзакцией записи и не ждёт блокировки.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._path = location
+        self._max_size = int(options.get('MAX_SIZE', 64 * 2 ** 20))
+        self._access_resolution = float(
+            options.get('ACCESS_RESOLUTION', 1.0)
+        )
+        self._local = threading.local()
+        self._pending_touches = {}
+
+    @property
+    def _db(self):
+        # Соединение нельзя переносить между потоками и через fork.
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            directory = os.path.dirname(self._path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            local.db = sqlite3.connect(
+                self._path, timeout=5, isolation_level=None,
+                check_same_thread=False,
+            )
+            for statement in PRAGMAS:
+                local.db.execute(statement)
+            local.db.execute('BEGIN IMMEDIATE')
+            try:
+                for statement in SCHEMA_SQL:
+                    local.db.execute(statement)
+            finally:
+                local.db.execute('COMMIT')
+            local.pid = os.getpid()
+        return local.db
+
+    def _transaction(self):
+        return _Immediate(self._db)
+
+    def _encode(self, value):
+        if type(value) is int:
+            return value, 8
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        return data, len(data)
+
+    def _decode(self, value):
+        if isinstance(value, int):
+            return value
+        return pickle.loads(value)
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def _select(self, db, keys, now):
+        marks = ', '.join('?' * len(keys))
+        return db.execute(
+            f'SELECT key, value, accessed FROM cache WHERE key IN ({marks}) '
+            f'AND (expires IS NULL OR expires > ?)',
+            (*keys, now)
+        ).fetchall()
+
+    def _touch_accessed(self, rows, now):
+        pending = self._pending_touches
+        for key, _, accessed in rows:
+            if now - accessed < self._access_resolution:
+                continue
+            # LRU приблизительный: при переполнении отметки теряются.
+            if key in pending or len(pending) < MAX_PENDING_TOUCHES:
+                pending[key] = now
+
+    def _flush_touches(self, db):
+        touches, self._pending_touches = self._pending_touches, {}
+        if touches:
+            db.executemany(
+                'UPDATE cache SET accessed = ? WHERE key = ?',
+                [(accessed, key) for key, accessed in touches.items()]
+            )
+
+    def _write(self, db, key, value, timeout, now):
+        data, size = self._encode(value)
+        db.execute(
+            UPSERT_SQL,
+            (key, data, self.get_backend_timeout(timeout), now, size)
+        )
+
+    def _cull(self, db, now):
+        # Вытеснение смотрит на время чтения, поэтому сначала пишутся
+        # накопленные отметки.
+        self._flush_touches(db)
+        entries, size = db.execute(
+            'SELECT entries, bytes FROM cache_stats'
+        ).fetchone()
+        if entries <= self._max_entries and size <= self._max_size:
+            return
+        db.execute('DELETE FROM cache WHERE expires <= ?', (now,))
+        while True:
+            entries, size = db.execute(
+                'SELECT entries, bytes FROM cache_stats'
+            ).fetchone()
+            excess_entries = entries - int(self._max_entries * CULL_TARGET)
+            excess_bytes = size - int(self._max_size * CULL_TARGET)
+            if entries == 0 or (excess_entries <= 0 and excess_bytes <= 0):
+                return
+            amount = max(
+                excess_entries, math.ceil(excess_bytes / (size / entries)), 1
+            )
+            db.execute(
+                'DELETE FROM cache WHERE key IN ('
+                'SELECT key FROM cache ORDER BY accessed LIMIT ?)',
+                (amount,)
+            )
+
+    def get(self, key, default=None, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        db = self._db
+        rows = self._select(db, [key], now)
+        if not rows:
+            return default
+        self._touch_accessed(rows, now)
+        return self._decode(rows[0][1])
+
+    def get_many(self, keys, version=None):
+        keys = {self._key(key, version): key for key in keys}
+        if not keys:
+            return {}
+        now = time.time()
+        db = self._db
+        names = list(keys)
+        rows = []
+        for start in range(0, len(names), MAX_VARIABLES):
+            rows += self._select(
+                db, names[start:start + MAX_VARIABLES], now
+            )
+        self._touch_accessed(rows, now)
+        return {keys[key]: self._decode(value) for key, value, _ in rows}
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        with self._transaction() as db:
+            self._write(db, key, value, timeout, now)
+            self._cull(db, now)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        now = time.time()
+        with self._transaction() as db:
+            for key, value in data.items():
+                self._write(db, self._key(key, version), value, timeout, now)
+            self._cull(db, now)
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        with self._transaction() as db:
+            if self._select(db, [key], now):
+                return False
+            self._write(db, key, value, timeout, now)
+            self._cull(db, now)
+        return True
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        with self._transaction() as db:
+            cursor = db.execute(
+                'UPDATE cache SET expires = ?, accessed = ? WHERE key = ? '
+                'AND (expires IS NULL OR expires > ?)',
+                (self.get_backend_timeout(timeout), now, key, now)
+            )
+        return cursor.rowcount > 0
+
+    def incr(self, key, delta=1, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        with self._transaction() as db:
+            db.execute(
+                "UPDATE cache SET value = value + ?, accessed = ? "
+                "WHERE key = ? AND typeof(value) = 'integer' "
+                "AND (expires IS NULL OR expires > ?)",
+                (delta, now, key, now)
+            )
+            rows = self._select(db, [key], now)
+        if not rows:
+            raise ValueError(f"Key '{key}' not found")
+        value = rows[0][1]
+        if not isinstance(value, int):
+            raise TypeError(f"Value of '{key}' is not an integer")
+        return value
+
+    def has_key(self, key, version=None):
+        key = self._key(key, version)
+        return bool(self._select(self._db, [key], time.time()))
+
+    def delete(self, key, version=None):
+        key = self._key(key, version)
+        with self._transaction() as db:
+            cursor = db.execute('DELETE FROM cache WHERE key = ?', (key,))
+        return cursor.rowcount > 0
+
+    def delete_many(self, keys, version=None):
+        keys = [(self._key(key, version),) for key in keys]
+        with self._transaction() as db:
+            db.executemany('DELETE FROM cache WHERE key = ?', keys)
+
+    def clear(self):
+        with self._transaction() as db:
+            db.execute('DELETE FROM cache')
+
+    def close(self, **kwargs):
+        # Соединение переиспользуется между запросами: открытие файла
+        # и PRAGMA дороже самих операций с кэшем.
+        pass
+
+
+class _Immediate:
+    """Транзакция с блокировкой на запись с самого начала.
+
+    Чтение и запись внутри неё атомарны для всех процессов, поэтому
+    `add` и `incr` не теряют параллельные обновления.
+    """
+
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        self.db.execute('BEGIN IMMEDIATE')
+        return self.db
+
+    def __exit__(self, exc_type, *exc_info):
+        self.db.execute('ROLLBACK' if exc_type else 'COMMIT')
@@ -0,0 +1,27 @@
+"""Настройка соединений SQLite через PRAGMA из `settings.SQLITE_PRAGMAS`."""
+from django.conf import settings
+
+PRODUCTION_PRAGMAS = {
+    # Читатели не блокируют писателя и наоборот.
+    'journal_mode': 'WAL',
+    # В режиме WAL fsync нужен только на контрольных точках.
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'mmap_size': 256 * 1024 * 1024,
+    # Отрицательное значение задаётся в килобайтах: 64 МБ.
+    'cache_size': -64000,
+    'temp_store': 'MEMORY',
+}
+
+
+def pragma_statements(pragmas):
+    return [f'PRAGMA {name} = {value}' for name, value in pragmas.items()]
+
+
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    pragmas = getattr(settings, 'SQLITE_PRAGMAS', None)
+    if connection.vendor != 'sqlite' or not pragmas:
+        return
+    with connection.cursor() as cursor:
+        for statement in pragma_statements(pragmas):
+            cursor.execute(statement)
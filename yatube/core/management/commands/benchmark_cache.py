@@ -0,0 +1,84 @@
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand
+
+from core.cache import SQLiteCache
+
+BACKENDS = (
+    ('LocMemCache', lambda directory, options: LocMemCache(
+        'benchmark', {'OPTIONS': options}
+    )),
+    ('FileBasedCache', lambda directory, options: FileBasedCache(
+        os.path.join(directory, 'files'), {'OPTIONS': options}
+    )),
+    ('SQLiteCache', lambda directory, options: SQLiteCache(
+        os.path.join(directory, 'cache.sqlite3'), {'OPTIONS': options}
+    )),
+)
+
+
+def work(job):
+    """Один воркер: читает популярные ключи и заполняет промахи.
+
+    Так ведёт себя кэш страниц: промах означает повторную отрисовку.
+    """
+    title, directory, options, keys, value_size, duration, seed = job
+    cache = dict(BACKENDS)[title](directory, options)
+    rng = random.Random(seed)
+    weights = [1 / rank for rank in range(1, keys + 1)]
+    value = 'x' * value_size
+    hits = misses = 0
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        for key in rng.choices(range(keys), weights, k=100):
+            if cache.get(f'page{key}') is None:
+                misses += 1
+                cache.set(f'page{key}', value)
+            else:
+                hits += 1
+            if key == 0:
+                cache.incr('generation')
+    return hits, misses
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает SQLiteCache с LocMemCache и FileBasedCache при '
+        'нескольких процессах: операции в секунду и доля попаданий'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--duration', type=float, default=5.0)
+        parser.add_argument('--keys', type=int, default=5000)
+        parser.add_argument('--value-size', type=int, default=20000)
+        parser.add_argument('--max-entries', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        duration = options['duration']
+        cache_options = {'MAX_ENTRIES': options['max_entries']}
+        context = multiprocessing.get_context('fork')
+        for title, factory in BACKENDS:
+            with tempfile.TemporaryDirectory() as directory:
+                factory(directory, cache_options).set('generation', 0)
+                jobs = [
+                    (title, directory, cache_options, options['keys'],
+                     options['value_size'], duration, seed)
+                    for seed in range(workers)
+                ]
+                with context.Pool(workers) as pool:
+                    results = pool.map(work, jobs)
+            hits = sum(hit for hit, _ in results)
+            misses = sum(miss for _, miss in results)
+            self.stdout.write(
+                f'{title:>15}: операций/с {(hits + misses) / duration:10.0f}'
+                f'  попаданий {hits / max(hits + misses, 1):6.1%}'
+                f'  промахов (перерисовок страниц) {misses}'
+            )
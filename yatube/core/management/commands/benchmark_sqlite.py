@@ -0,0 +1,158 @@
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, connections, transaction
+from django.test.utils import override_settings
+
+from core.db import PRODUCTION_PRAGMAS
+from posts.models import Comment, Post, User
+from posts.paginators import CursorPaginator
+from posts.views import POSTS_AMOUNT
+
+# Название, PRAGMA, постоянные соединения, OPTIONS соединения — как в
+# yatube.settings и yatube.settings_production.
+PROFILES = (
+    ('стандартный', {}, False, {}),
+    ('боевой', PRODUCTION_PRAGMAS, True, {'timeout': 5}),
+)
+
+
+class Workload:
+    """Запросы страниц сайта и добавление комментариев через ORM.
+
+    Каждый поток работает со своим соединением Django, поэтому к нему
+    применяются `SQLITE_PRAGMAS` (см. `core.db.apply_sqlite_pragmas`).
+    """
+
+    def __init__(self, persistent, posts, authors):
+        self.persistent = persistent
+        self.posts = posts
+        self.authors = authors
+        self.reads = 0
+        self.writes = 0
+        self.locked = 0
+        self.lock = threading.Lock()
+
+    def read(self):
+        # Те же запросы, что у главной страницы, профиля и поста.
+        CursorPaginator(
+            Post.objects.select_related('author', 'group'), POSTS_AMOUNT
+        ).cursor_page()
+        CursorPaginator(
+            Post.objects.filter(
+                author_id=random.choice(self.authors)
+            ).select_related('group'),
+            POSTS_AMOUNT,
+        ).cursor_page()
+        post = Post.objects.select_related('author__counters', 'group').get(
+            pk=random.choice(self.posts)
+        )
+        list(post.comments.select_related('author'))
+
+    def write(self):
+        with transaction.atomic():
+            Comment.objects.create(
+                post_id=random.choice(self.posts),
+                author_id=random.choice(self.authors),
+                text='Комментарий для замера',
+            )
+
+    def worker(self, operation, counter, deadline):
+        done = locked = 0
+        while time.monotonic() < deadline:
+            try:
+                operation()
+                done += 1
+            except OperationalError:
+                locked += 1
+            finally:
+                if not self.persistent:
+                    connection.close()
+        connection.close()
+        with self.lock:
+            setattr(self, counter, getattr(self, counter) + done)
+            self.locked += locked
+
+    def run(self, readers, writers, duration):
+        deadline = time.monotonic() + duration
+        threads = [
+            threading.Thread(
+                target=self.worker, args=(self.read, 'reads', deadline)
+            )
+            for _ in range(readers)
+        ] + [
+            threading.Thread(
+                target=self.worker, args=(self.write, 'writes', deadline)
+            )
+            for _ in range(writers)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает пропускную способность SQLite на запросах страниц '
+        'сайта со стандартными настройками и с SQLITE_PRAGMAS и '
+        'постоянными соединениями'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=8)
+        parser.add_argument('--writers', type=int, default=2)
+        parser.add_argument('--duration', type=float, default=5.0)
+
+    def copy_database(self, path):
+        # Комментарии пишутся в копию, а не в рабочую базу.
+        connection.ensure_connection()
+        target = sqlite3.connect(path)
+        with target:
+            connection.connection.backup(target)
+        target.close()
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('Замер имеет смысл только для SQLite')
+        posts = list(
+            Post.objects.order_by('?').values_list('pk', flat=True)[:1000]
+        )
+        authors = list(
+            User.objects.order_by('?').values_list('pk', flat=True)[:1000]
+        )
+        if not posts:
+            raise CommandError(
+                'В базе нет постов: заполните её командой seed'
+            )
+        database = settings.DATABASES['default']
+        original = {key: database.get(key) for key in ('NAME', 'OPTIONS')}
+        duration = options['duration']
+        try:
+            for title, pragmas, persistent, db_options in PROFILES:
+                with tempfile.TemporaryDirectory() as directory:
+                    path = os.path.join(directory, 'benchmark.sqlite3')
+                    self.copy_database(path)
+                    connections.close_all()
+                    database.update(NAME=path, OPTIONS=db_options)
+                    workload = Workload(persistent, posts, authors)
+                    with override_settings(SQLITE_PRAGMAS=pragmas):
+                        workload.run(
+                            options['readers'], options['writers'], duration
+                        )
+                    connections.close_all()
+                    database.update(original)
+                self.stdout.write(
+                    f'{title:>12}: страниц/с {workload.reads / duration:8.0f}'
+                    f'  комментариев/с {workload.writes / duration:8.0f}'
+                    f'  "database is locked": {workload.locked}'
+                )
+        finally:
+            connections.close_all()
+            database.update(original)
@@ -0,0 +1,46 @@
+"""Окружение тестов: отдельный файл кэша и миниатюры без пула.
+
+`cache.clear()` в тестах иначе стирал бы `cache.sqlite3` запущенного
+рядом сервера. Варианты картинок создаются в том же процессе, чтобы
+тесты видели их сразу после коммита и не запускали процессы пула.
+"""
+import os
+import tempfile
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+@contextmanager
+def temporary_caches():
+    """Кэши из настроек, но в файлах временного каталога."""
+    with tempfile.TemporaryDirectory() as directory:
+        caches = {
+            alias: {
+                **params,
+                'LOCATION': os.path.join(directory, f'{alias}.sqlite3'),
+            }
+            for alias, params in settings.CACHES.items()
+        }
+        with override_settings(CACHES=caches):
+            yield
+
+
+@contextmanager
+def isolated_settings():
+    """Настройки, общие для manage.py test и pytest."""
+    with temporary_caches(), override_settings(THUMBNAIL_WORKERS=0):
+        yield
+
+
+class TestRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._settings = isolated_settings()
+        self._settings.__enter__()
+
+    def teardown_test_environment(self, **kwargs):
+        self._settings.__exit__(None, None, None)
+        super().teardown_test_environment(**kwargs)
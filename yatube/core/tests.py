@@ -0,0 +1,142 @@
+# core/tests.py
+import multiprocessing
+import os
+import tempfile
+import time
+
+from django.db import connections
+from django.test import SimpleTestCase, override_settings
+
+from .cache import SQLiteCache
+from .db import PRODUCTION_PRAGMAS
+
+
+def increment(path, times):
+    cache = SQLiteCache(path, {})
+    for _ in range(times):
+        cache.incr('counter')
+
+
+class SQLiteCacheTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'cache.sqlite3')
+        self.cache = self.make_cache()
+
+    def make_cache(self, **options):
+        return SQLiteCache(self.path, {'OPTIONS': options})
+
+    def test_get_set(self):
+        """Значения сохраняются и читаются, в том числе пачкой"""
+        self.cache.set('text', 'Пост')
+        self.cache.set_many({'one': 1, 'list': [1, 2]})
+        self.assertEqual(self.cache.get('text'), 'Пост')
+        self.assertEqual(
+            self.cache.get_many(['one', 'list', 'missing']),
+            {'one': 1, 'list': [1, 2]},
+        )
+        self.assertIsNone(self.cache.get('missing'))
+        self.cache.delete_many(['one', 'list'])
+        self.assertEqual(self.cache.get_many(['one', 'list']), {})
+
+    def test_add_incr_and_timeout(self):
+        """add не перезаписывает значение, истёкшие записи не видны"""
+        self.assertTrue(self.cache.add('counter', 1))
+        self.assertFalse(self.cache.add('counter', 5))
+        self.assertEqual(self.cache.incr('counter', 2), 3)
+        self.assertEqual(self.cache.decr('counter'), 2)
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+        self.cache.set('expired', 'значение', timeout=0)
+        self.assertFalse(self.cache.has_key('expired'))
+        self.assertTrue(self.cache.add('expired', 'новое'))
+
+    def test_shared_between_instances(self):
+        """Запись одного процесса видна другим, incr атомарен"""
+        self.cache.set('counter', 0)
+        context = multiprocessing.get_context('fork')
+        workers = [
+            context.Process(target=increment, args=(self.path, 50))
+            for _ in range(4)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(self.make_cache().get('counter'), 200)
+
+    def test_lru_eviction(self):
+        """При переполнении вытесняются давно не читавшиеся записи"""
+        cache = self.make_cache(MAX_ENTRIES=10, ACCESS_RESOLUTION=0)
+        for i in range(10):
+            cache.set(f'key{i}', i)
+        cache.get('key0')
+        cache.set('key10', 10)
+        self.assertEqual(cache.get('key0'), 0)
+        self.assertIsNone(cache.get('key1'))
+        self.assertLessEqual(len(cache.get_many(
+            [f'key{i}' for i in range(11)]
+        )), 10)
+
+    def test_reads_do_not_write(self):
+        """Чтение не открывает транзакцию записи"""
+        cache = self.make_cache(ACCESS_RESOLUTION=0)
+        cache.set('key', 'value')
+        other = self.make_cache()
+        with other._transaction():
+            # Файл заблокирован на запись другим соединением: запись
+            # времени чтения ждала бы busy_timeout.
+            start = time.monotonic()
+            self.assertEqual(cache.get('key'), 'value')
+            self.assertEqual(cache.get_many(['key']), {'key': 'value'})
+            self.assertLess(time.monotonic() - start, 1)
+
+    def test_size_cap(self):
+        """Суммарный объём значений не превышает MAX_SIZE"""
+        cache = self.make_cache(MAX_SIZE=10000)
+        for i in range(20):
+            cache.set(f'key{i}', 'x' * 1000)
+        stored = cache.get_many([f'key{i}' for i in range(20)])
+        self.assertLessEqual(len(stored) * 1000, 10000)
+        self.assertIn('key19', stored)
+
+
+class SQLitePragmasTests(SimpleTestCase):
+    def open_connection(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        default = connections['default']
+        wrapper = default.__class__(
+            {
+                **default.settings_dict,
+                'NAME': os.path.join(directory.name, 'db.sqlite3'),
+            },
+            alias='pragmas',
+        )
+        wrapper.ensure_connection()
+        self.addCleanup(wrapper.close)
+        return wrapper
+
+    def pragma(self, wrapper, name):
+        with wrapper.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    @override_settings(SQLITE_PRAGMAS=PRODUCTION_PRAGMAS)
+    def test_production_pragmas_applied(self):
+        """Новое соединение получает PRAGMA из SQLITE_PRAGMAS"""
+        wrapper = self.open_connection()
+        self.assertEqual(self.pragma(wrapper, 'journal_mode'), 'wal')
+        # NORMAL
+        self.assertEqual(self.pragma(wrapper, 'synchronous'), 1)
+        self.assertEqual(self.pragma(wrapper, 'busy_timeout'), 5000)
+        self.assertEqual(self.pragma(wrapper, 'cache_size'), -64000)
+        # MEMORY
+        self.assertEqual(self.pragma(wrapper, 'temp_store'), 2)
+
+    @override_settings(SQLITE_PRAGMAS={})
+    def test_defaults_without_pragmas(self):
+        """Без SQLITE_PRAGMAS соединение остаётся со стандартными PRAGMA"""
+        wrapper = self.open_connection()
+        self.assertEqual(self.pragma(wrapper, 'journal_mode'), 'delete')
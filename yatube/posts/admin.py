@@ -1,6 +1,7 @@
 from django.contrib import admin
 
 from .models import Comment, Follow, Group, Post
+from .search import match_expression, matching_ids
 
 
 class PostAdmin(admin.ModelAdmin):
@@ -17,6 +18,12 @@ class PostAdmin(admin.ModelAdmin):
     list_filter = ('pub_date',)
     empty_value_display = '-пусто-'
 
+    def get_search_results(self, request, queryset, search_term):
+        """Поиск через индекс FTS5 вместо LIKE по всей таблице."""
+        if not match_expression(search_term):
+            return queryset, False
+        return queryset.filter(pk__in=matching_ids(search_term)), False
+
 
 class CommentAdmin(admin.ModelAdmin):
     list_display = (
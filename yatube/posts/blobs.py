@@ -0,0 +1,62 @@
+"""Счётчики ссылок постов на файлы картинок.
+
+С хранилищем по хешу содержимого (`posts.storage`) один файл может
+принадлежать многим постам, поэтому удалить его можно только тогда,
+когда ссылок не осталось: такие файлы находит по счётчикам команда
+`collect_media_garbage`. Счётчики меняются в транзакции записи поста,
+так что откат не оставляет лишних ссылок.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+
+from .models import ImageBlob, Post
+
+BATCH_SIZE = 500
+
+
+def retain(name):
+    if ImageBlob.objects.filter(name=name).update(
+        references=F('references') + 1
+    ):
+        return
+    try:
+        with transaction.atomic():
+            ImageBlob.objects.create(name=name, references=1)
+    except IntegrityError:
+        # Строку только что создал параллельный запрос.
+        ImageBlob.objects.filter(name=name).update(
+            references=F('references') + 1
+        )
+
+
+def release(name):
+    ImageBlob.objects.filter(name=name, references__gt=0).update(
+        references=F('references') - 1
+    )
+
+
+def rebuild_image_references():
+    """Пересчитывает ссылки по таблице постов, возвращает число файлов."""
+    references = list(
+        Post.objects.exclude(image='').order_by().values('image').annotate(
+            amount=Count('pk')
+        ).values_list('image', 'amount')
+    )
+    ImageBlob.objects.update(references=0)
+    for start in range(0, len(references), BATCH_SIZE):
+        batch = dict(references[start:start + BATCH_SIZE])
+        existing = set(ImageBlob.objects.filter(
+            name__in=batch
+        ).values_list('name', flat=True))
+        blobs = [
+            ImageBlob(name=name, references=amount)
+            for name, amount in batch.items()
+        ]
+        ImageBlob.objects.bulk_update(
+            [blob for blob in blobs if blob.name in existing],
+            ['references'],
+        )
+        ImageBlob.objects.bulk_create(
+            [blob for blob in blobs if blob.name not in existing]
+        )
+    return len(references)
@@ -0,0 +1,263 @@
+"""Кэширование страниц с поколениями вместо короткого времени жизни.
+
+Вместе со страницей хранится номер поколения списка постов. Любая
+запись постов, групп, пользователей или подписок увеличивает номер,
+и все закэшированные страницы сразу считаются устаревшими, поэтому
+сами страницы можно хранить часами.
+
+Устаревшую страницу пересчитывает один запрос, а остальные до конца
+пересчёта получают старую копию, так что сброс поколения не
+превращается в одновременную отрисовку страницы всеми воркерами.
+
+В кэше лежит оболочка страницы, общая для всех пользователей: части,
+зависящие от пользователя, заполняются для каждого ответа отдельно
+(см. `posts.holes`).
+"""
+import hashlib
+import math
+import random
+import threading
+import time
+from collections import Counter
+from functools import partial, wraps
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import patch_cache_control
+
+from .holes import fill_holes, new_nonce
+
+GENERATION_KEY = 'posts:generation'
+# Число комментариев есть только в ответах API, поэтому страницы сайта
+# не сбрасываются от каждого нового комментария.
+COMMENTS_GENERATION_KEY = 'posts:comments-generation'
+PAGE_CACHE_TIMEOUT = 60 * 60 * 4
+# Сколько устаревшая копия может отдаваться после срока свежести.
+STALE_TIMEOUT = 60 * 60 * 24
+# Блокировка пересчёта снимается сама, если воркер упал.
+LOCK_TIMEOUT = 30
+XFETCH_BETA = 1.0
+
+HIT, MISS, STALE, REFRESH = 'hit', 'miss', 'stale', 'refresh'
+STATES = (HIT, MISS, STALE, REFRESH)
+STATS_KEY = 'posts:page-cache-stats'
+STATS_FLUSH_EVENTS = 100
+STATS_FLUSH_SECONDS = 10
+
+
+def get_generation(key=GENERATION_KEY):
+    generation = cache.get(key)
+    if generation is None:
+        # Начинаем с метки времени, чтобы после вытеснения ключа
+        # не вернуться к номеру, под которым лежат старые страницы.
+        cache.add(key, int(time.time() * 1000), timeout=None)
+        generation = cache.get(key)
+    return generation
+
+
+def _incr_generation(key=GENERATION_KEY):
+    try:
+        cache.incr(key)
+    except ValueError:
+        get_generation(key)
+
+
+def bump_generation(key=GENERATION_KEY):
+    """Сбрасывает кэш страниц сейчас и ещё раз после коммита.
+
+    Повтор после коммита не даёт параллельному запросу сохранить
+    в новом поколении данные, прочитанные до окончания транзакции.
+    """
+    _incr_generation(key)
+    transaction.on_commit(partial(_incr_generation, key))
+
+
+class CachedPage:
+    """Сохранённый ответ и сведения, нужные для решения о его обновлении."""
+
+    def __init__(self, response, nonce, generation, expires, delta):
+        self.response = response
+        # Метки фрагментов в оболочке содержат этот nonce.
+        self.nonce = nonce
+        # Поколение списка, а для страниц с `version` — пара из
+        # поколения и версии объекта.
+        self.generation = generation
+        self.expires = expires
+        # Сколько секунд заняла отрисовка: от неё зависит, насколько
+        # заранее имеет смысл обновлять запись.
+        self.delta = delta
+
+    def should_refresh(self, now, beta=XFETCH_BETA):
+        """Вероятностное раннее обновление (XFetch).
+
+        Чем ближе срок и чем дольше отрисовка, тем вероятнее, что
+        запрос обновит запись заранее, и одновременного промаха у всех
+        запросов в момент истечения не случается.
+        """
+        jitter = -self.delta * beta * math.log(1.0 - random.random())
+        return now + jitter >= self.expires
+
+
+def _page_key(key_prefix, request):
+    path = hashlib.md5(request.get_full_path().encode('utf-8')).hexdigest()
+    # Сотрудники видят точное число записей, поэтому их оболочка своя.
+    audience = 'staff' if request.user.is_staff else 'all'
+    return f'posts:page:{key_prefix}:{audience}:{path}'
+
+
+def page_etag(request, *parts):
+    """ETag страницы из поколения, пользователя, адреса и `parts`.
+
+    Вычисляется без чтения данных страницы, поэтому ответ 304 не
+    требует ни запросов к постам, ни отрисовки шаблона.
+    """
+    user_id = request.user.pk if request.user.is_authenticated else 0
+    data = ':'.join(
+        str(part) for part in (
+            get_generation(), user_id, request.get_full_path(), *parts
+        )
+    )
+    return hashlib.md5(data.encode('utf-8')).hexdigest()
+
+
+def list_etag(request, *args, **kwargs):
+    """ETag страниц со списками постов: меняется вместе с поколением."""
+    return page_etag(request)
+
+
+def comments_list_etag(request, *args, **kwargs):
+    """ETag списков постов с числом комментариев."""
+    return page_etag(request, get_generation(COMMENTS_GENERATION_KEY))
+
+
+def _render(view, request, key, generation, timeout, *args, **kwargs):
+    started = time.monotonic()
+    request.page_shell = nonce = new_nonce()
+    try:
+        response = view(request, *args, **kwargs)
+    finally:
+        del request.page_shell
+    if response.streaming:
+        return response
+    if response.status_code == 200 and not response.cookies:
+        entry = CachedPage(
+            response, nonce, generation, time.time() + timeout,
+            time.monotonic() - started,
+        )
+        cache.set(key, entry, timeout + STALE_TIMEOUT)
+    return _fill(response, nonce, request)
+
+
+def _fill(response, nonce, request):
+    text = response.content.decode(response.charset)
+    response.content = fill_holes(text, nonce, request)
+    return response
+
+
+def _cached(entry, request):
+    return _fill(entry.response, entry.nonce, request)
+
+
+def _mark(response, state):
+    stats.record(state)
+    response['X-Cache'] = state
+    return response
+
+
+def cache_page_versioned(timeout, key_prefix, version=None):
+    """Кэширует страницу до смены поколения или истечения `timeout`.
+
+    Устаревшую страницу пересчитывает только запрос, который первым
+    взял блокировку, остальные в это время получают старую копию.
+    `version(request, *args, **kwargs)` — версия объекта страницы,
+    которую меняют записи, не сбрасывающие поколение.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            key = _page_key(key_prefix, request)
+            generation = get_generation()
+            if version is not None:
+                generation = (
+                    generation, version(request, *args, **kwargs)
+                )
+            entry = cache.get(key)
+            now = time.time()
+            fresh = (
+                entry is not None
+                and entry.generation == generation
+                and now < entry.expires
+            )
+            if fresh and not entry.should_refresh(now):
+                return _mark(_cached(entry, request), HIT)
+            if not cache.add(f'{key}:lock', 1, LOCK_TIMEOUT):
+                if fresh:
+                    return _mark(_cached(entry, request), HIT)
+                if entry is not None:
+                    # ETag описывает текущее поколение, а не эту копию:
+                    # клиент не должен сохранять её и присылать обратно.
+                    patch_cache_control(entry.response, no_store=True)
+                    return _mark(_cached(entry, request), STALE)
+                # Старой копии нет: отрисовываем сами, не дожидаясь.
+                return _mark(view(request, *args, **kwargs), MISS)
+            try:
+                response = _render(
+                    view, request, key, generation, timeout, *args, **kwargs
+                )
+            finally:
+                cache.delete(f'{key}:lock')
+            return _mark(response, REFRESH if fresh else MISS)
+        return wrapper
+    return decorator
+
+
+class PageCacheStats:
+    """Счётчики попаданий, промахов и устаревших ответов кэша страниц.
+
+    Счётчики копятся в процессе и переносятся в общий кэш пачкой,
+    чтобы каждое попадание не превращалось в запись.
+    """
+
+    def __init__(self):
+        self.pending = Counter()
+        self.flushed_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def record(self, state):
+        with self.lock:
+            self.pending[state] += 1
+            due = (
+                sum(self.pending.values()) >= STATS_FLUSH_EVENTS
+                or time.monotonic() - self.flushed_at >= STATS_FLUSH_SECONDS
+            )
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            pending, self.pending = self.pending, Counter()
+            self.flushed_at = time.monotonic()
+        for state, amount in pending.items():
+            key = f'{STATS_KEY}:{state}'
+            cache.add(key, 0, timeout=None)
+            try:
+                cache.incr(key, amount)
+            except ValueError:
+                cache.set(key, amount, timeout=None)
+
+    def totals(self):
+        """Счётчики всех процессов вместе с ещё не перенесёнными."""
+        self.flush()
+        keys = {f'{STATS_KEY}:{state}': state for state in STATES}
+        values = cache.get_many(list(keys))
+        return {state: values.get(key, 0) for key, state in keys.items()}
+
+    def reset(self):
+        with self.lock:
+            self.pending.clear()
+        cache.delete_many([f'{STATS_KEY}:{state}' for state in STATES])
+
+
+stats = PageCacheStats()
@@ -0,0 +1,127 @@
+"""Денормализованные счётчики постов, комментариев и подписок.
+
+Счётчики меняются обработчиками сигналов в той же транзакции, что и
+сама запись, а страницы читают готовые значения вместо `COUNT(*)`.
+"""
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Comment, Follow, Post, PostCounter, User, UserCounters
+
+ALL_POSTS = 'all'
+
+
+def group_scope(group_id):
+    return f'group:{group_id}'
+
+
+def _count_subquery(queryset, field, outer='pk'):
+    counted = queryset.filter(**{field: OuterRef(outer)}).order_by().values(
+        field
+    ).annotate(amount=Count('pk')).values('amount')
+    return Coalesce(
+        Subquery(counted, output_field=IntegerField()), 0
+    )
+
+
+def rebuild_user_counters(user_ids=None):
+    """Пересчитывает счётчики пользователей (всех или `user_ids`)."""
+    users = User.objects.all()
+    if user_ids is not None:
+        users = users.filter(pk__in=user_ids)
+    user_ids_query = users.values_list('pk', flat=True)
+    UserCounters.objects.bulk_create(
+        [UserCounters(user_id=pk) for pk in user_ids_query],
+        batch_size=500,
+        ignore_conflicts=True,
+    )
+    counters = UserCounters.objects.all()
+    if user_ids is not None:
+        counters = counters.filter(user_id__in=user_ids)
+    return counters.update(
+        posts_count=_count_subquery(
+            Post.objects.all(), 'author', outer='user_id'
+        ),
+        followers_count=_count_subquery(
+            Follow.objects.all(), 'author', outer='user_id'
+        ),
+        following_count=_count_subquery(
+            Follow.objects.all(), 'user', outer='user_id'
+        ),
+    )
+
+
+def rebuild_comment_counters():
+    return Post.objects.update(
+        comments_count=_count_subquery(Comment.objects.all(), 'post')
+    )
+
+
+def rebuild_post_counters():
+    """Пересчитывает общее число постов и число постов в каждой группе."""
+    totals = {ALL_POSTS: Post.objects.count()}
+    per_group = Post.objects.filter(group__isnull=False).order_by().values(
+        'group'
+    ).annotate(amount=Count('pk')).values_list('group', 'amount')
+    for group_id, amount in per_group:
+        totals[group_scope(group_id)] = amount
+    PostCounter.objects.all().delete()
+    PostCounter.objects.bulk_create(
+        [
+            PostCounter(scope=scope, posts_count=amount)
+            for scope, amount in totals.items()
+        ],
+        batch_size=500,
+    )
+    return len(totals)
+
+
+def change_post_counters(group_id, delta, total=True):
+    scopes = [ALL_POSTS] if total else []
+    if group_id is not None:
+        scopes.append(group_scope(group_id))
+    # Отсутствующие строки посчитает posts_total() при чтении.
+    PostCounter.objects.filter(scope__in=scopes).update(
+        posts_count=F('posts_count') + delta
+    )
+
+
+def change_user_counters(user_id, **deltas):
+    # Если строки ещё нет, её точно посчитает user_counters() при чтении.
+    UserCounters.objects.filter(user_id=user_id).update(**{
+        name: F(name) + delta for name, delta in deltas.items()
+    })
+
+
+def change_comments_count(post_id, delta):
+    Post.objects.filter(pk=post_id).update(
+        comments_count=F('comments_count') + delta
+    )
+
+
+def user_counters(user):
+    """Счётчики пользователя; создаёт строку, если её ещё нет."""
+    try:
+        return user.counters
+    except UserCounters.DoesNotExist:
+        rebuild_user_counters([user.pk])
+        return UserCounters.objects.get(user_id=user.pk)
+
+
+def posts_total(group_id=None):
+    """Число постов из счётчика: всего или в группе `group_id`."""
+    if group_id is None:
+        scope, posts = ALL_POSTS, Post.objects.all()
+    else:
+        scope, posts = group_scope(group_id), Post.objects.filter(
+            group_id=group_id
+        )
+    total = PostCounter.objects.filter(scope=scope).values_list(
+        'posts_count', flat=True
+    ).first()
+    if total is None:
+        total = posts.count()
+        PostCounter.objects.get_or_create(
+            scope=scope, defaults={'posts_count': total}
+        )
+    return total
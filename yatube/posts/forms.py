@@ -1,6 +1,7 @@
 from django.forms import ModelForm
 
 from .models import Comment, Post
+from .uploads import RejectedUpload
 
 
 class PostForm(ModelForm):
@@ -8,6 +9,24 @@ class PostForm(ModelForm):
         model = Post
         fields = ["text", "group", "image"]
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Файлы, отклонённые обработчиком загрузки ещё до декодирования:
+        # ImageField их не видит, а причина отказа показывается в clean.
+        self.rejected_uploads = {}
+        for name, upload in list(self.files.items()):
+            if isinstance(upload, RejectedUpload):
+                if not self.rejected_uploads:
+                    self.files = self.files.copy()
+                self.rejected_uploads[name] = upload.error
+                del self.files[name]
+
+    def clean(self):
+        cleaned_data = super().clean()
+        for name, error in self.rejected_uploads.items():
+            self.add_error(name, error)
+        return cleaned_data
+
 
 class CommentForm(ModelForm):
     class Meta:
@@ -0,0 +1,88 @@
+"""«Дырки» в общей оболочке страницы для частей, зависящих от пользователя.
+
+Кэш страниц хранит одну оболочку на всех: вместо ссылок входа, вкладок
+ленты, кнопки подписки и формы комментария в ней стоят метки
+`<!--hole:...-->`. Перед ответом каждая метка заменяется маленьким
+фрагментом, отрисованным для текущего пользователя, поэтому дорогая
+часть страницы (карточки постов, пагинатор) у всех общая.
+
+Текст постов экранируется шаблоном, так что подделать метку им нельзя,
+а случайный `nonce` оболочки не даёт заменить чужой комментарий HTML.
+"""
+import re
+import secrets
+from urllib.parse import parse_qsl, urlencode
+
+from django.template.loader import get_template
+
+from .forms import CommentForm
+from .models import Follow
+
+HOLES = {}
+HOLE_RE = re.compile(
+    r'<!--hole:(?P<nonce>\w+):(?P<name>\w+):(?P<params>[^>]*)-->'
+)
+
+
+def hole(name, template_name):
+    """Регистрирует фрагмент `name` и функцию, готовящую его контекст.
+
+    Функция получает запрос и параметры метки строками.
+    """
+    def decorator(func):
+        HOLES[name] = (template_name, func)
+        return func
+    return decorator
+
+
+@hole('header_user', 'includes/header_user.html')
+def header_user(request):
+    return {}
+
+
+@hole('switcher', 'posts/includes/switcher.html')
+def switcher(request):
+    return {}
+
+
+@hole('follow_button', 'posts/includes/follow_button.html')
+def follow_button(request, author):
+    user = request.user
+    return {
+        'author_username': author,
+        'show': user.get_username() != author,
+        'following': user.is_authenticated and Follow.objects.filter(
+            user=user, author__username=author
+        ).exists(),
+    }
+
+
+@hole('comment_form', 'posts/includes/comment_form.html')
+def comment_form(request, post_id):
+    return {'post_id': post_id, 'comment_form': CommentForm()}
+
+
+def new_nonce():
+    return secrets.token_hex(8)
+
+
+def render_hole(request, name, params):
+    template_name, context = HOLES[name]
+    return get_template(template_name).render(
+        context(request, **params), request
+    )
+
+
+def placeholder(nonce, name, params):
+    return f'<!--hole:{nonce}:{name}:{urlencode(params)}-->'
+
+
+def fill_holes(text, nonce, request):
+    """Подставляет в текст оболочки фрагменты текущего пользователя."""
+    def replace(match):
+        if match['nonce'] != nonce:
+            return match[0]
+        params = dict(parse_qsl(match['params']))
+        return render_hole(request, match['name'], params)
+
+    return HOLE_RE.sub(replace, text)
@@ -0,0 +1,59 @@
+from django.core.files.images import get_image_dimensions
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+
+from posts.cache import bump_generation
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет сохранённые размеры картинок постов, загруженных '
+        'до появления полей image_width и image_height'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        posts = Post.objects.exclude(image='').filter(
+            image_width__isnull=True
+        ).only('pk', 'image').order_by('pk')
+        filled = missing = 0
+        last_pk = 0
+        while True:
+            # Порциями по первичному ключу: заполненные посты выпадают
+            # из выборки, а ненайденные файлы не читаются повторно.
+            batch = list(posts.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+            ready = []
+            for post in batch:
+                try:
+                    with default_storage.open(post.image.name) as image:
+                        width, height = get_image_dimensions(image)
+                except OSError:
+                    width = height = None
+                if width is None:
+                    missing += 1
+                    continue
+                post.image_width, post.image_height = width, height
+                ready.append(post)
+            # Карточки с новой версией получат размеры в <img>.
+            with transaction.atomic():
+                Post.objects.bulk_update(
+                    ready, ['image_width', 'image_height']
+                )
+                Post.objects.filter(
+                    pk__in=[post.pk for post in ready]
+                ).update(version=F('version') + 1)
+            filled += len(ready)
+        if filled:
+            bump_generation()
+        self.stdout.write(self.style.SUCCESS(
+            f'Заполнено постов: {filled}, картинок не найдено: {missing}'
+        ))
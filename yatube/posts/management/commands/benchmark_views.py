@@ -0,0 +1,297 @@
+import json
+import math
+import platform
+import time
+from contextlib import ExitStack, contextmanager
+from unittest import mock
+
+import django
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.backends.utils import CursorWrapper
+from django.db.models import Count
+from django.template.backends.django import Template
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+
+from posts.models import Comment, Group, Post, User
+
+VIEWS = (
+    'index', 'group_posts', 'profile', 'post_detail', 'follow_index',
+    'post_create', 'add_comment',
+)
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(values, rank):
+    """Процентиль по методу ближайшего ранга."""
+    ordered = sorted(values)
+    index = max(0, math.ceil(rank / 100 * len(ordered)) - 1)
+    return ordered[index]
+
+
+class Probe:
+    """Считает запросы, время в БД и время отрисовки шаблонов.
+
+    Время БД включает чтение строк: SQLite выполняет большую часть
+    запроса уже после `execute`, во время `fetchmany`. Запросы,
+    выполненные во время отрисовки (ленивые QuerySet в шаблоне),
+    относятся к БД, а не к шаблону.
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self._rendering = False
+        self._render_db_time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries += 1
+        return self.timed(execute, sql, params, many, context)
+
+    def timed(self, function, *args):
+        started = time.perf_counter()
+        try:
+            return function(*args)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.db_time += elapsed
+            if self._rendering:
+                self._render_db_time += elapsed
+
+    def fetch(self, method):
+        probe = self
+
+        def wrapper(cursor, *args):
+            return probe.timed(getattr(cursor.cursor, method), *args)
+        return wrapper
+
+    def render(self, render):
+        probe = self
+
+        def wrapper(template, *args, **kwargs):
+            if probe._rendering:
+                return render(template, *args, **kwargs)
+            probe._rendering = True
+            probe._render_db_time = 0.0
+            started = time.perf_counter()
+            try:
+                return render(template, *args, **kwargs)
+            finally:
+                probe._rendering = False
+                probe.template_time += (
+                    time.perf_counter() - started - probe._render_db_time
+                )
+        return wrapper
+
+    @contextmanager
+    def attached(self):
+        render = self.render(Template.render)
+        with ExitStack() as stack:
+            stack.enter_context(connection.execute_wrapper(self))
+            stack.enter_context(
+                mock.patch.object(Template, 'render', render)
+            )
+            for method in ('fetchone', 'fetchmany', 'fetchall'):
+                stack.enter_context(mock.patch.object(
+                    CursorWrapper, method, self.fetch(method), create=True
+                ))
+            yield self
+
+
+class Scenario:
+    """Один запрос к представлению: метод, адрес и данные формы."""
+
+    def __init__(self, name, url, method='get', data=None, client=None):
+        self.name = name
+        self.url = url
+        self.method = method
+        self.data = data or {}
+        self.client = client
+
+    def request(self):
+        if self.method == 'post':
+            # Записи откатываются, чтобы прогон не менял базу.
+            with transaction.atomic():
+                response = self.client.post(self.url, self.data)
+                transaction.set_rollback(True)
+        else:
+            response = self.client.get(self.url, self.data)
+        if response.status_code >= 400:
+            raise CommandError(
+                f'{self.name}: {self.url} вернул {response.status_code}'
+            )
+        return response
+
+
+class Command(BaseCommand):
+    help = (
+        'Измеряет задержку, число запросов, время в БД и время шаблонов '
+        'основных страниц на текущей базе (см. manage.py seed)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--warmup', type=int, default=10)
+        parser.add_argument(
+            '--views', nargs='+', choices=VIEWS, default=list(VIEWS),
+        )
+        parser.add_argument(
+            '--cached', action='store_true',
+            help='Не очищать кэш перед запросами',
+        )
+        parser.add_argument('--output', help='Куда сохранить JSON')
+        parser.add_argument(
+            '--baseline', help='JSON прошлого прогона для сравнения',
+        )
+        parser.add_argument(
+            '--threshold', type=float, default=0.2,
+            help='Допустимый рост p95 и числа запросов, доля',
+        )
+
+    def scenarios(self, views):
+        post = Post.objects.order_by('-comments_count', '-pk').first()
+        group = Group.objects.annotate(
+            amount=Count('posts')
+        ).order_by('-amount').first()
+        author = User.objects.order_by('-counters__posts_count').first()
+        reader = User.objects.order_by('-counters__following_count').first()
+        if not (post and group and author and reader):
+            raise CommandError(
+                'В базе нет данных, сначала выполните manage.py seed'
+            )
+        guest, client = Client(), Client()
+        client.force_login(reader)
+        scenarios = {
+            'index': Scenario(
+                'index', reverse('posts:index'), client=guest,
+            ),
+            'group_posts': Scenario(
+                'group_posts',
+                reverse('posts:group_list', kwargs={'slug': group.slug}),
+                client=guest,
+            ),
+            'profile': Scenario(
+                'profile',
+                reverse('posts:profile',
+                        kwargs={'username': author.username}),
+                client=client,
+            ),
+            'post_detail': Scenario(
+                'post_detail',
+                reverse('posts:post_detail', kwargs={'post_id': post.pk}),
+                client=client,
+            ),
+            'follow_index': Scenario(
+                'follow_index', reverse('posts:follow_index'), client=client,
+            ),
+            'post_create': Scenario(
+                'post_create', reverse('posts:post_create'), method='post',
+                data={'text': 'Пост из бенчмарка', 'group': group.pk},
+                client=client,
+            ),
+            'add_comment': Scenario(
+                'add_comment',
+                reverse('posts:add_comment', kwargs={'post_id': post.pk}),
+                method='post', data={'text': 'Комментарий из бенчмарка'},
+                client=client,
+            ),
+        }
+        return [scenarios[name] for name in views]
+
+    def measure(self, scenario, requests, warmup, cached):
+        for _ in range(warmup):
+            scenario.request()
+        latencies, queries, db_times, template_times = [], [], [], []
+        for _ in range(requests):
+            if not cached:
+                cache.clear()
+            probe = Probe()
+            with probe.attached():
+                started = time.perf_counter()
+                scenario.request()
+                latencies.append(time.perf_counter() - started)
+            queries.append(probe.queries)
+            db_times.append(probe.db_time)
+            template_times.append(probe.template_time)
+        result = {
+            f'p{rank}_ms': percentile(latencies, rank) * 1000
+            for rank in PERCENTILES
+        }
+        result.update({
+            'mean_ms': sum(latencies) / requests * 1000,
+            'queries': sum(queries) / requests,
+            'db_ms': sum(db_times) / requests * 1000,
+            'template_ms': sum(template_times) / requests * 1000,
+            'requests': requests,
+        })
+        return result
+
+    def compare(self, results, baseline, threshold):
+        """Представления, у которых p95 или число запросов выросли."""
+        regressions = []
+        for name, result in results.items():
+            before = baseline.get(name)
+            if not before:
+                continue
+            for metric in ('p95_ms', 'queries'):
+                if result[metric] > before[metric] * (1 + threshold):
+                    regressions.append(
+                        f'{name}: {metric} {before[metric]:.2f} -> '
+                        f'{result[metric]:.2f}'
+                    )
+        return regressions
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1:
+            raise CommandError('--requests должно быть больше нуля')
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline'], encoding='utf-8') as source:
+                baseline = json.load(source)['results']
+
+        results = {}
+        for scenario in self.scenarios(options['views']):
+            results[scenario.name] = result = self.measure(
+                scenario, options['requests'], options['warmup'],
+                options['cached'],
+            )
+            self.stdout.write(
+                f'{scenario.name:>13}: '
+                + '  '.join(
+                    f'p{rank} {result[f"p{rank}_ms"]:7.2f} мс'
+                    for rank in PERCENTILES
+                )
+                + f'  запросов {result["queries"]:5.1f}'
+                f'  БД {result["db_ms"]:7.2f} мс'
+                f'  шаблоны {result["template_ms"]:7.2f} мс'
+            )
+
+        if options['output']:
+            report = {
+                'created': timezone.now().isoformat(),
+                'environment': {
+                    'python': platform.python_version(),
+                    'django': django.get_version(),
+                    'database': connection.vendor,
+                    'posts': Post.objects.count(),
+                    'comments': Comment.objects.count(),
+                    'cached': options['cached'],
+                },
+                'results': results,
+            }
+            with open(options['output'], 'w', encoding='utf-8') as target:
+                json.dump(report, target, ensure_ascii=False, indent=2)
+
+        if baseline is not None:
+            regressions = self.compare(
+                results, baseline, options['threshold']
+            )
+            if regressions:
+                raise CommandError(
+                    'Производительность ухудшилась:\n' + '\n'.join(regressions)
+                )
+            self.stdout.write('Регрессий относительно базового прогона нет')
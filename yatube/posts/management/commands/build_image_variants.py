@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from posts.cache import bump_generation
+from posts.models import Post
+from posts.thumbnails import generate
+
+
+class Command(BaseCommand):
+    help = (
+        'Создаёт варианты картинок постов для srcset: по умолчанию только '
+        'для постов, у которых их ещё нет'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Пересоздать варианты всех картинок',
+        )
+
+    def handle(self, *args, **options):
+        posts = Post.objects.exclude(image='')
+        if not options['all']:
+            posts = posts.filter(image_variants__isnull=True)
+        names = list(posts.order_by('image').values_list(
+            'image', flat=True
+        ).distinct())
+        # Варианты каждой картинки заменяются в своей транзакции, так
+        # что прерванный запуск не оставляет посты без вариантов.
+        for name in names:
+            generate(name, reuse=not options['all'], invalidate_pages=False)
+        if names:
+            bump_generation()
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано картинок: {len(names)}'
+        ))
@@ -0,0 +1,302 @@
+import json
+import os
+import time
+from collections import Counter
+from itertools import islice
+
+from django.core.management.base import BaseCommand
+from sorl.thumbnail import default
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.helpers import deserialize
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import KVStore
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from posts.models import ImageBlob, Post, PostImageVariant
+
+PHASES = {
+    'blobs': 'Картинки без ссылок',
+    'originals': 'Файлы вне счётчиков ссылок',
+    'sources': 'Миниатюры удалённых картинок',
+    'thumbnails': 'Файлы миниатюр без записей',
+}
+
+
+def batches(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _files(storage, directory):
+    with os.scandir(storage.path(directory)) as entries:
+        for entry in entries:
+            if entry.is_file():
+                yield f'{directory}/{entry.name}'
+
+
+def walk(storage, top, after=None):
+    """Каталоги под `top`: пары (каталог, итератор его файлов).
+
+    Каталоги обходятся в порядке имён, поэтому каталоги до `after`
+    включительно можно пропустить вместе с поддеревьями.
+    """
+    done = tuple(after.split('/')) if after else ()
+
+    def visit(directory):
+        key = tuple(directory.split('/'))
+        try:
+            with os.scandir(storage.path(directory)) as entries:
+                subdirs = sorted(
+                    entry.name for entry in entries if entry.is_dir()
+                )
+        except FileNotFoundError:
+            return
+        if key > done:
+            yield directory, _files(storage, directory)
+        for name in subdirs:
+            subkey = key + (name,)
+            # Поддерево целиком раньше `after`, если `after` не в нём.
+            if subkey < done and done[:len(subkey)] != subkey:
+                continue
+            yield from visit(f'{directory}/{name}')
+
+    yield from visit(top)
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет картинки, на которые не ссылается ни один пост, '
+        'и миниатюры без исходных картинок'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать, что будет удалено',
+        )
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--rate', type=float, default=0,
+            help='Не больше стольких удалений в секунду (0 — без ограничения)',
+        )
+        parser.add_argument(
+            '--min-age', type=int, default=60 * 60 * 24,
+            help='Не удалять файлы моложе стольких секунд',
+        )
+        parser.add_argument(
+            '--checkpoint',
+            help='Файл с позицией для продолжения прерванного запуска',
+        )
+
+    # Позиция сохраняется после каждого каталога или порции записей
+    # sorl-thumbnail, и прерванный запуск продолжается с неё.
+    def handle(self, *args, **options):
+        self.dry_run = options['dry_run']
+        self.batch_size = options['batch_size']
+        self.rate = options['rate']
+        self.min_age = options['min_age']
+        self.scanned = Counter()
+        self.removed = Counter()
+        self.freed = Counter()
+        checkpoint = options['checkpoint']
+        state = self.load_checkpoint(checkpoint)
+        phases = list(PHASES)
+        if state:
+            phases = phases[phases.index(state['phase']):]
+        if not isinstance(default.kvstore, KVStore):
+            self.stderr.write(
+                'Миниатюры пропущены: записи sorl-thumbnail хранятся '
+                'не в базе'
+            )
+            phases = [
+                phase for phase in phases if phase in ('blobs', 'originals')
+            ]
+        for phase in phases:
+            after = None
+            if state and state['phase'] == phase:
+                after = state['after']
+            for position in getattr(self, f'collect_{phase}')(after):
+                if checkpoint and not self.dry_run:
+                    self.save_checkpoint(checkpoint, phase, position)
+            self.report(phase)
+        if checkpoint and not self.dry_run and os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        self.stdout.write(self.style.SUCCESS(
+            f'{"Будет удалено" if self.dry_run else "Удалено"} файлов: '
+            f'{sum(self.removed.values())}, '
+            f'{sum(self.freed.values()) / 2 ** 20:.1f} МБ'
+        ))
+
+    def load_checkpoint(self, path):
+        if not path or not os.path.exists(path):
+            return None
+        with open(path) as checkpoint:
+            return json.load(checkpoint)
+
+    def save_checkpoint(self, path, phase, position):
+        # Через временный файл: прерванная запись не портит позицию.
+        with open(f'{path}.tmp', 'w') as checkpoint:
+            json.dump({'phase': phase, 'after': position}, checkpoint)
+        os.replace(f'{path}.tmp', path)
+
+    def report(self, phase):
+        self.stdout.write(
+            f'{PHASES[phase]}: просмотрено {self.scanned[phase]}, '
+            f'{"будет удалено" if self.dry_run else "удалено"} '
+            f'{self.removed[phase]} ({self.freed[phase] / 2 ** 20:.1f} МБ)'
+        )
+
+    def throttle(self, amount=1):
+        if self.rate and not self.dry_run:
+            time.sleep(amount / self.rate)
+
+    def remove(self, phase, storage, name):
+        """Удаляет давно не менявшийся файл; True, если он удалён."""
+        # Возраст проверяется перед самым удалением: повторная загрузка
+        # того же файла обновляет время его изменения.
+        try:
+            stat = os.stat(storage.path(name))
+        except FileNotFoundError:
+            return False
+        if time.time() - stat.st_mtime < self.min_age:
+            return False
+        if not self.dry_run:
+            storage.delete(name)
+            self.throttle()
+        self.removed[phase] += 1
+        self.freed[phase] += stat.st_size
+        return True
+
+    def collect_blobs(self, after):
+        """Картинки, у которых счётчик ссылок дошёл до нуля."""
+        storage = Post._meta.get_field('image').storage
+        rows = ImageBlob.objects.filter(references=0).order_by(
+            'name'
+        ).values_list('name', flat=True)
+        while True:
+            page = rows.filter(name__gt=after) if after else rows
+            batch = list(page[:self.batch_size])
+            if not batch:
+                return
+            after = batch[-1]
+            self.scanned['blobs'] += len(batch)
+            # Разошедшийся с постами счётчик чинит rebuild_counters, а
+            # до тех пор файл, который есть у поста, не удаляется.
+            live = set(Post.objects.filter(
+                image__in=batch
+            ).values_list('image', flat=True))
+            gone = [
+                name for name in batch
+                if name not in live and (
+                    self.remove('blobs', storage, name)
+                    or not storage.exists(name)
+                )
+            ]
+            if gone and not self.dry_run:
+                # Пока шла порция, картинку могли загрузить снова.
+                ImageBlob.objects.filter(
+                    name__in=gone, references=0
+                ).delete()
+            yield after
+
+    def collect_originals(self, after):
+        """Файлы без записи о ссылках, которые не нужны ни одному посту.
+
+        Это варианты картинок, картинки, загруженные до появления
+        счётчиков, и файлы, оставшиеся от отменённых сохранений поста.
+        """
+        # Варианты лежат в posts/variants/ в том же MEDIA_ROOT.
+        storage = Post._meta.get_field('image').storage
+        for directory, files in walk(storage, 'posts', after):
+            for batch in batches(files, self.batch_size):
+                self.scanned['originals'] += len(batch)
+                # Файлы со счётчиком ссылок — забота collect_blobs.
+                used = set(ImageBlob.objects.filter(
+                    name__in=batch
+                ).values_list('name', flat=True))
+                used.update(Post.objects.filter(
+                    image__in=batch
+                ).values_list('image', flat=True))
+                used.update(PostImageVariant.objects.filter(
+                    image__in=batch
+                ).values_list('image', flat=True))
+                for name in batch:
+                    if name not in used:
+                        self.remove('originals', storage, name)
+            yield directory
+
+    def collect_sources(self, after):
+        """Записи sorl-thumbnail картинок, которых нет ни у одного поста."""
+        prefix = add_prefix('', identity='thumbnails')
+        rows = KVStoreModel.objects.filter(
+            key__startswith=prefix
+        ).order_by('key').values_list('key', 'value')
+        while True:
+            page = rows.filter(key__gt=after) if after else rows
+            batch = dict(page[:self.batch_size])
+            if not batch:
+                return
+            after = max(batch)
+            # Ключ записи картинки тот же, что у списка её миниатюр.
+            thumbnails = {
+                add_prefix(key[len(prefix):]): deserialize(value)
+                for key, value in batch.items()
+            }
+            sources = {
+                key: deserialize_image_file(value)
+                for key, value in KVStoreModel.objects.filter(
+                    key__in=thumbnails
+                ).values_list('key', 'value')
+            }
+            self.scanned['sources'] += len(sources)
+            live = set(Post.objects.filter(
+                image__in=[source.name for source in sources.values()]
+            ).values_list('image', flat=True))
+            stale = {
+                key: source for key, source in sources.items()
+                if source.name.startswith('posts/') and source.name not in live
+            }
+            files = [
+                deserialize_image_file(value).name
+                for value in KVStoreModel.objects.filter(key__in=[
+                    add_prefix(thumbnail)
+                    for key in stale for thumbnail in thumbnails[key]
+                ]).values_list('value', flat=True)
+            ]
+            for name in files:
+                try:
+                    self.freed['sources'] += default.storage.size(name)
+                except OSError:
+                    continue
+                self.removed['sources'] += 1
+            if not self.dry_run:
+                for key, source in stale.items():
+                    # Удаляет файлы миниатюр и их записи, затем запись
+                    # исходной картинки.
+                    default.kvstore.delete(source)
+                    self.throttle(len(thumbnails[key]) + 1)
+            yield after
+
+    def collect_thumbnails(self, after):
+        """Файлы миниатюр, о которых не знает sorl-thumbnail."""
+        storage = default.storage
+        top = sorl_settings.THUMBNAIL_PREFIX.rstrip('/')
+        for directory, files in walk(storage, top, after):
+            for batch in batches(files, self.batch_size):
+                self.scanned['thumbnails'] += len(batch)
+                keys = {
+                    add_prefix(ImageFile(name, storage).key): name
+                    for name in batch
+                }
+                known = set(KVStoreModel.objects.filter(
+                    key__in=keys
+                ).values_list('key', flat=True))
+                for key, name in keys.items():
+                    if key not in known:
+                        self.remove('thumbnails', storage, name)
+            yield directory
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from posts.cache import HIT, MISS, REFRESH, STALE, stats
+
+
+class Command(BaseCommand):
+    help = 'Показывает попадания, промахи и устаревшие ответы кэша страниц'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reset', action='store_true',
+            help='Обнулить счётчики после вывода',
+        )
+
+    def handle(self, *args, **options):
+        totals = stats.totals()
+        requests = sum(totals.values())
+        served = totals[HIT] + totals[STALE]
+        self.stdout.write(
+            f'Попаданий: {totals[HIT]}, устаревших копий: {totals[STALE]}, '
+            f'промахов: {totals[MISS]}, ранних обновлений: {totals[REFRESH]}'
+        )
+        if requests:
+            self.stdout.write(
+                f'Отдано из кэша: {served / requests:.1%} запросов'
+            )
+        if options['reset']:
+            stats.reset()
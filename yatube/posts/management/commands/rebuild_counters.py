@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts.blobs import rebuild_image_references
+from posts.counters import (rebuild_comment_counters, rebuild_post_counters,
+                            rebuild_user_counters)
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает счётчики постов, комментариев и подписок, '
+        'общее число постов, число постов в группах и ссылки на картинки'
+    )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            users = rebuild_user_counters()
+            posts = rebuild_comment_counters()
+            scopes = rebuild_post_counters()
+            images = rebuild_image_references()
+        self.stdout.write(self.style.SUCCESS(
+            f'Пересчитано пользователей: {users}, постов: {posts}, '
+            f'счётчиков постов: {scopes}, картинок: {images}'
+        ))
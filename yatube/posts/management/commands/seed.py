@@ -0,0 +1,293 @@
+import bisect
+import itertools
+import multiprocessing
+import random
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, connections, transaction
+from django.utils import timezone
+from faker import Faker
+
+from posts import feed, search
+from posts.cache import bump_generation
+from posts.counters import (rebuild_comment_counters, rebuild_post_counters,
+                            rebuild_user_counters)
+from posts.models import Comment, Follow, Group, Post, User
+
+SENTENCES_POOL = 2000
+
+
+@contextmanager
+def explicit_dates():
+    """Позволяет задать pub_date и created вместо текущего времени."""
+    fields = [
+        Post._meta.get_field('pub_date'),
+        Comment._meta.get_field('created'),
+    ]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+class PowerLaw:
+    """Выбор идентификаторов с вероятностью ~ 1 / rank ** alpha."""
+
+    def __init__(self, ids, alpha, rng):
+        self.ids = list(ids)
+        rng.shuffle(self.ids)
+        self.cum_weights = list(itertools.accumulate(
+            1 / rank ** alpha for rank in range(1, len(self.ids) + 1)
+        ))
+        self.total = self.cum_weights[-1]
+        self.rng = rng
+
+    def choice(self):
+        point = self.rng.random() * self.total
+        return self.ids[bisect.bisect(self.cum_weights, point)]
+
+
+class Generator:
+    """Всё, что нужно процессу для генерации своей доли постов."""
+
+    def __init__(self, options, user_ids, group_ids, seed):
+        self.options = options
+        self.rng = random.Random(seed)
+        faker = Faker('ru_RU')
+        faker.seed_instance(seed)
+        self.sentences = [faker.sentence() for _ in range(SENTENCES_POOL)]
+        self.authors = PowerLaw(user_ids, options['alpha'], self.rng)
+        self.group_ids = group_ids
+        self.user_ids = user_ids
+        self.now = timezone.now()
+        self.span = timedelta(days=options['days']).total_seconds()
+
+    def text(self, sentences):
+        return ' '.join(self.rng.sample(self.sentences, sentences))
+
+    def bursts(self, amount):
+        """Посты сериями: автор пишет несколько постов за короткое время."""
+        while amount > 0:
+            author_id = self.authors.choice()
+            moment = self.now - timedelta(
+                seconds=self.rng.random() * self.span
+            )
+            group_id = self.rng.choice(self.group_ids + [None])
+            size = min(amount, int(self.rng.expovariate(1 / 4)) + 1)
+            for _ in range(size):
+                yield Post(
+                    text=self.text(self.rng.randint(1, 6)),
+                    author_id=author_id,
+                    group_id=group_id,
+                    pub_date=moment,
+                )
+                moment += timedelta(seconds=self.rng.expovariate(1 / 300))
+            amount -= size
+
+    def comments(self, amount, first_post_id, last_post_id):
+        for _ in range(amount):
+            # Свежие посты комментируют чаще.
+            offset = int(self.rng.expovariate(1 / 1000))
+            yield Comment(
+                post_id=max(first_post_id, last_post_id - offset),
+                author_id=self.rng.choice(self.user_ids),
+                text=self.text(self.rng.randint(1, 2)),
+                created=self.now - timedelta(
+                    seconds=self.rng.random() * self.span
+                ),
+            )
+
+
+def insert_batches(model, objects, batch_size):
+    """Вставляет объекты пачками по `batch_size`, каждую в транзакции.
+
+    Размер отдельного INSERT выбирает Django: SQLite ограничивает число
+    строк в одном запросе.
+    """
+    created = 0
+    while True:
+        batch = list(itertools.islice(objects, batch_size))
+        if not batch:
+            return created
+        with transaction.atomic():
+            model.objects.bulk_create(batch)
+        created += len(batch)
+
+
+def seed_posts(job):
+    """Задание одного процесса: вставить `amount` постов."""
+    options, user_ids, group_ids, seed, amount = job
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA busy_timeout = 60000')
+    generator = Generator(options, user_ids, group_ids, seed)
+    return insert_batches(
+        Post, generator.bursts(amount), options['batch_size']
+    )
+
+
+def seed_comments(job):
+    """Задание одного процесса: вставить `amount` комментариев."""
+    options, user_ids, group_ids, seed, amount, first_id, last_id = job
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA busy_timeout = 60000')
+    generator = Generator(options, user_ids, group_ids, seed)
+    return insert_batches(
+        Comment,
+        generator.comments(amount, first_id, last_id),
+        options['batch_size'],
+    )
+
+
+def split(amount, parts):
+    return [amount // parts + (i < amount % parts) for i in range(parts)]
+
+
+class Command(BaseCommand):
+    help = 'Заполняет базу синтетическими данными для нагрузочных тестов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--groups', type=int, default=50)
+        parser.add_argument('--posts', type=int, default=100000)
+        parser.add_argument('--comments', type=int, default=100000)
+        parser.add_argument(
+            '--follows', type=int, default=20,
+            help='Среднее число подписок на пользователя',
+        )
+        parser.add_argument(
+            '--alpha', type=float, default=1.1,
+            help='Показатель степенного закона популярности авторов',
+        )
+        parser.add_argument(
+            '--days', type=int, default=365,
+            help='За сколько дней распределить публикации',
+        )
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--workers', type=int, default=1,
+            help='Число процессов для генерации постов и комментариев',
+        )
+        parser.add_argument('--seed', type=int, default=None)
+
+    def log(self, message, started):
+        self.stdout.write(f'{message} за {time.monotonic() - started:.1f} с')
+
+    def create_users(self, amount, rng, batch_size):
+        faker = Faker('ru_RU')
+        faker.seed_instance(rng.random())
+        prefix = self.prefix
+        users = (
+            User(
+                username=f'{prefix}_{i}',
+                first_name=faker.first_name(),
+                last_name=faker.last_name(),
+                password='!',
+            )
+            for i in range(amount)
+        )
+        insert_batches(User, users, batch_size)
+        return list(User.objects.filter(
+            username__startswith=f'{prefix}_'
+        ).values_list('pk', flat=True))
+
+    def create_groups(self, amount, rng, batch_size):
+        faker = Faker('ru_RU')
+        faker.seed_instance(rng.random())
+        prefix = self.prefix
+        groups = (
+            Group(
+                title=faker.word().capitalize(),
+                slug=f'{prefix}-{i}',
+                description=faker.sentence(),
+            )
+            for i in range(amount)
+        )
+        insert_batches(Group, groups, batch_size)
+        return list(Group.objects.filter(
+            slug__startswith=f'{prefix}-'
+        ).values_list('pk', flat=True))
+
+    def create_follows(self, user_ids, average, alpha, rng, batch_size):
+        """Подписки со степенным распределением популярности авторов."""
+        authors = PowerLaw(user_ids, alpha, rng)
+
+        def follows():
+            for user_id in user_ids:
+                amount = min(
+                    len(user_ids) - 1, int(rng.expovariate(1 / average))
+                )
+                targets = set()
+                for _ in range(amount * 2):
+                    if len(targets) >= amount:
+                        break
+                    author_id = authors.choice()
+                    if author_id != user_id:
+                        targets.add(author_id)
+                for author_id in targets:
+                    yield Follow(user_id=user_id, author_id=author_id)
+
+        insert_batches(Follow, follows(), batch_size)
+
+    def run_jobs(self, function, jobs, workers):
+        if workers <= 1:
+            return sum(map(function, jobs))
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        with context.Pool(workers) as pool:
+            return sum(pool.imap_unordered(function, jobs))
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        batch_size = options['batch_size']
+        workers = max(1, options['workers'])
+        started = time.monotonic()
+        # Префикс имён отличает строки этого запуска от уже созданных.
+        self.prefix = f'seed{int(time.time()):x}{rng.getrandbits(16):04x}'
+
+        user_ids = self.create_users(options['users'], rng, batch_size)
+        group_ids = self.create_groups(options['groups'], rng, batch_size)
+        self.log(f'Пользователей: {len(user_ids)}, групп: {len(group_ids)}',
+                 started)
+        if not user_ids:
+            return
+
+        self.create_follows(
+            user_ids, options['follows'], options['alpha'], rng, batch_size
+        )
+        self.log('Подписки созданы', started)
+
+        with explicit_dates(), search.deferred_index():
+            last_id = Post.objects.order_by('-pk').values_list(
+                'pk', flat=True
+            ).first() or 0
+            jobs = [
+                (options, user_ids, group_ids, rng.random(), amount)
+                for amount in split(options['posts'], workers)
+            ]
+            posts = self.run_jobs(seed_posts, jobs, workers)
+            self.log(f'Постов: {posts}', started)
+
+            first_id, max_id = last_id + 1, Post.objects.order_by(
+                '-pk'
+            ).values_list('pk', flat=True).first() or 0
+            if max_id >= first_id:
+                jobs = [
+                    (options, user_ids, group_ids, rng.random(), amount,
+                     first_id, max_id)
+                    for amount in split(options['comments'], workers)
+                ]
+                comments = self.run_jobs(seed_comments, jobs, workers)
+                self.log(f'Комментариев: {comments}', started)
+
+        feed.rebuild()
+        rebuild_user_counters()
+        rebuild_comment_counters()
+        rebuild_post_counters()
+        bump_generation()
+        self.log('Ленты, счётчики и поисковый индекс обновлены', started)
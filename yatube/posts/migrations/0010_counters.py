@@ -0,0 +1,69 @@
+# Generated by Django 2.2.16 on 2026-10-18 02:32
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+import django.db.models.deletion
+
+
+def count_subquery(queryset, field, outer):
+    counted = queryset.filter(**{field: OuterRef(outer)}).order_by().values(
+        field
+    ).annotate(amount=Count('pk')).values('amount')
+    return Coalesce(Subquery(counted, output_field=IntegerField()), 0)
+
+
+def fill_counters(apps, schema_editor):
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    Post = apps.get_model('posts', 'Post')
+    Comment = apps.get_model('posts', 'Comment')
+    Follow = apps.get_model('posts', 'Follow')
+    UserCounters = apps.get_model('posts', 'UserCounters')
+    UserCounters.objects.bulk_create(
+        [UserCounters(user_id=pk)
+         for pk in User.objects.values_list('pk', flat=True)],
+        batch_size=500,
+    )
+    UserCounters.objects.update(
+        posts_count=count_subquery(Post.objects.all(), 'author', 'user_id'),
+        followers_count=count_subquery(
+            Follow.objects.all(), 'author', 'user_id'
+        ),
+        following_count=count_subquery(
+            Follow.objects.all(), 'user', 'user_id'
+        ),
+    )
+    Post.objects.update(
+        comments_count=count_subquery(Comment.objects.all(), 'post', 'pk')
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0011_update_proxy_permissions'),
+        ('posts', '0009_feedentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserCounters',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='counters', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+                ('posts_count', models.PositiveIntegerField(default=0, help_text='Количество постов пользователя', verbose_name='Посты')),
+                ('followers_count', models.PositiveIntegerField(default=0, help_text='Количество подписчиков пользователя', verbose_name='Подписчики')),
+                ('following_count', models.PositiveIntegerField(default=0, help_text='Количество авторов, на которых подписан пользователь', verbose_name='Подписки')),
+            ],
+            options={
+                'verbose_name': 'Счётчики пользователя',
+                'verbose_name_plural': 'Счётчики пользователей',
+            },
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='comments_count',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Количество комментариев к посту', verbose_name='Комментарии'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.16 on 2026-10-18 02:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0012_post_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='version',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Растёт при каждом изменении поста и его комментариев', verbose_name='Версия'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 2.2.16 on 2026-10-18 03:01
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_post_counters(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    PostCounter = apps.get_model('posts', 'PostCounter')
+    counters = [PostCounter(scope='all', posts_count=Post.objects.count())]
+    per_group = Post.objects.filter(group__isnull=False).order_by().values(
+        'group'
+    ).annotate(amount=Count('pk')).values_list('group', 'amount')
+    counters += [
+        PostCounter(scope=f'group:{group_id}', posts_count=amount)
+        for group_id, amount in per_group
+    ]
+    PostCounter.objects.bulk_create(counters, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0013_post_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostCounter',
+            fields=[
+                ('scope', models.CharField(help_text='«all» для всех постов или «group:<id>» для группы', max_length=64, primary_key=True, serialize=False, verbose_name='Область')),
+                ('posts_count', models.PositiveIntegerField(default=0, help_text='Количество постов в области', verbose_name='Посты')),
+            ],
+            options={
+                'verbose_name': 'Счётчик постов',
+                'verbose_name_plural': 'Счётчики постов',
+            },
+        ),
+        migrations.RunPython(fill_post_counters, migrations.RunPython.noop),
+    ]
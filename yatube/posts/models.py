@@ -1,6 +1,8 @@
 from django.contrib.auth import get_user_model
 from django.db import models
 
+from .storage import ContentAddressedStorage
+
 User = get_user_model()
 
 
@@ -14,6 +16,8 @@ class Group(models.Model):
 
 
 class Post(models.Model):
+    COUNTER_FIELDS = ('comments_count', 'version')
+
     text = models.TextField(
         verbose_name="Текст",
         help_text="Текст нового поста",
@@ -42,17 +46,75 @@ class Post(models.Model):
     image = models.ImageField(
         verbose_name='Картинка',
         upload_to='posts/',
+        storage=ContentAddressedStorage(),
         blank=True
     )
+    # Размеры картинки хранятся в строке поста, чтобы страницы не
+    # открывали файл ради атрибутов width и height.
+    image_width = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name="Ширина картинки",
+        help_text="Ширина картинки в пикселях",
+    )
+    image_height = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name="Высота картинки",
+        help_text="Высота картинки в пикселях",
+    )
+    comments_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name="Комментарии",
+        help_text="Количество комментариев к посту",
+    )
+    version = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name="Версия",
+        help_text="Растёт при каждом изменении, видном на страницах поста",
+    )
 
     class Meta:
         ordering = ('-pub_date',)
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
 
+        indexes = [
+            models.Index(
+                fields=["-pub_date", "-id"], name="post_pub_date_idx"
+            ),
+            models.Index(
+                fields=["author", "-pub_date", "-id"],
+                name="post_author_pub_date_idx"
+            ),
+            models.Index(
+                fields=["group", "-pub_date", "-id"],
+                name="post_group_pub_date_idx"
+            ),
+        ]
+
     def __str__(self):
         return self.text[:15]
 
+    def save(self, force_insert=False, force_update=False, using=None,
+             update_fields=None):
+        # Счётчики меняются только запросами с F(): полная запись строки
+        # экземпляром, прочитанным раньше, откатила бы чужие изменения.
+        if update_fields is None and not force_insert \
+                and not self._state.adding:
+            deferred = self.get_deferred_fields()
+            update_fields = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.attname not in deferred
+                and field.name not in self.COUNTER_FIELDS
+            ]
+        super().save(force_insert, force_update, using, update_fields)
+
 
 class Comment(models.Model):
     post = models.ForeignKey(
@@ -82,9 +144,16 @@ class Comment(models.Model):
     )
 
     class Meta:
+        ordering = ('created',)
         verbose_name = 'Комментарий'
         verbose_name_plural = 'Комментарии'
 
+        indexes = [
+            models.Index(
+                fields=["post", "created"], name="comment_post_created_idx"
+            ),
+        ]
+
     def __str__(self):
         return self.text[:15]
 
@@ -108,7 +177,7 @@ class Follow(models.Model):
     class Meta:
         verbose_name = 'Подписка'
         verbose_name_plural = 'Подписки'
-        
+
         constraints = [
             models.UniqueConstraint(
                 fields=["user", "author"], name="already_following"
@@ -118,3 +187,169 @@ class Follow(models.Model):
                 name="not_self_follow"
             )
         ]
+
+
+class FeedEntry(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed',
+        verbose_name="Подписчик",
+        help_text="Владелец ленты",
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name="Пост",
+        help_text="Пост в ленте",
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name="Автор",
+        help_text="Автор поста",
+    )
+    pub_date = models.DateTimeField(
+        verbose_name="Дата публикации",
+        help_text="Дата публикации поста",
+    )
+
+    class Meta:
+        ordering = ('-pub_date',)
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+
+        indexes = [
+            models.Index(
+                fields=["user", "-pub_date", "-post"],
+                name="feed_user_pub_date_post_idx"
+            ),
+            models.Index(
+                fields=["user", "author"], name="feed_user_author_idx"
+            ),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "post"], name="unique_feed_entry"
+            ),
+        ]
+
+
+class UserCounters(models.Model):
+    user = models.OneToOneField(
+        User,
+        primary_key=True,
+        on_delete=models.CASCADE,
+        related_name='counters',
+        verbose_name="Пользователь",
+    )
+    posts_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name="Посты",
+        help_text="Количество постов пользователя",
+    )
+    followers_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name="Подписчики",
+        help_text="Количество подписчиков пользователя",
+    )
+    following_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name="Подписки",
+        help_text="Количество авторов, на которых подписан пользователь",
+    )
+
+    class Meta:
+        verbose_name = 'Счётчики пользователя'
+        verbose_name_plural = 'Счётчики пользователей'
+
+    def __str__(self):
+        return str(self.user)
+
+
+class PostCounter(models.Model):
+    scope = models.CharField(
+        max_length=64,
+        primary_key=True,
+        verbose_name="Область",
+        help_text="«all» для всех постов или «group:<id>» для группы",
+    )
+    posts_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name="Посты",
+        help_text="Количество постов в области",
+    )
+
+    class Meta:
+        verbose_name = 'Счётчик постов'
+        verbose_name_plural = 'Счётчики постов'
+
+    def __str__(self):
+        return self.scope
+
+
+class ImageBlob(models.Model):
+    name = models.CharField(
+        max_length=255,
+        primary_key=True,
+        verbose_name="Файл",
+        help_text="Имя файла картинки в хранилище",
+    )
+    references = models.PositiveIntegerField(
+        default=0,
+        verbose_name="Ссылки",
+        help_text="Количество постов с этой картинкой",
+    )
+
+    class Meta:
+        verbose_name = 'Файл картинки'
+        verbose_name_plural = 'Файлы картинок'
+
+    def __str__(self):
+        return self.name
+
+
+class PostImageVariant(models.Model):
+    JPEG = 'jpeg'
+    WEBP = 'webp'
+    FORMATS = (
+        (WEBP, 'WebP'),
+        (JPEG, 'JPEG'),
+    )
+
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='image_variants',
+        verbose_name="Пост",
+        help_text="Пост, к картинке которого относится вариант",
+    )
+    image = models.ImageField(
+        upload_to='posts/variants/',
+        verbose_name="Файл",
+        help_text="Уменьшенная копия картинки поста",
+    )
+    format = models.CharField(
+        max_length=4,
+        choices=FORMATS,
+        verbose_name="Формат",
+    )
+    width = models.PositiveIntegerField(verbose_name="Ширина")
+    height = models.PositiveIntegerField(verbose_name="Высота")
+
+    class Meta:
+        ordering = ('format', 'width')
+        verbose_name = 'Вариант картинки'
+        verbose_name_plural = 'Варианты картинок'
+
+        constraints = [
+            models.UniqueConstraint(
+                fields=["post", "format", "width"],
+                name="unique_post_image_variant"
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.image.name} ({self.width}x{self.height})'
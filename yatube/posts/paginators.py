@@ -0,0 +1,185 @@
+"""Постраничный вывод по ключу (pub_date, id) вместо OFFSET.
+
+Страница выбирается условием по ключу последней показанной записи,
+поэтому стоимость запроса не зависит от глубины листания и не требует
+`COUNT(*)`. Курсоры передаются в адресе как непрозрачные токены
+`?after=` и `?before=`.
+
+Общее число записей, если оно нужно, берётся из стратегии подсчёта:
+готового счётчика или `cached_count`. Без стратегии выполняется
+точный `COUNT(*)`.
+"""
+import hashlib
+from functools import wraps
+
+from django.core.cache import cache
+from django.core.paginator import Page, Paginator
+from django.db.models import Q
+from django.shortcuts import redirect
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+from django.utils.encoding import force_bytes, force_str
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
+
+CURSOR_KEYS = ('pub_date', 'id')
+COUNT_CACHE_TIMEOUT = 60 * 5
+PAGE_CURSOR_TIMEOUT = 60 * 60
+# Дальше этой страницы `?page=N` ведёт на первую страницу без
+# OFFSET-запроса: так глубоко листают только роботы.
+MAX_PAGE_NUMBER = 100
+
+
+class PageMoved(Exception):
+    """Старый адрес `?page=N` нужно перенаправить на курсор."""
+
+    def __init__(self, url, permanent=False):
+        super().__init__(url)
+        self.url = url
+        self.permanent = permanent
+
+
+def encode_cursor(pub_date, pk):
+    return urlsafe_base64_encode(force_bytes(f'{pub_date.isoformat()}|{pk}'))
+
+
+def decode_cursor(token):
+    """Возвращает (pub_date, pk) или None для испорченного токена."""
+    try:
+        pub_date, pk = force_str(urlsafe_base64_decode(token)).split('|')
+        pub_date = parse_datetime(pub_date)
+        pk = int(pk)
+    except (TypeError, ValueError, UnicodeDecodeError):
+        return None
+    if pub_date is None:
+        return None
+    return pub_date, pk
+
+
+class CursorPaginator(Paginator):
+    """Paginator, листающий по ключу вместо номера страницы.
+
+    `keys` — поля даты и идентификатора, по которым упорядочен список.
+    Страницы отдаются обычным `Page` с атрибутами `next_cursor` и
+    `previous_cursor`. `count` — функция без аргументов, возвращающая
+    общее число записей.
+    """
+
+    def __init__(self, object_list, per_page, keys=CURSOR_KEYS, count=None):
+        self.keys = keys
+        self.count_strategy = count
+        super().__init__(self.order(object_list), per_page)
+
+    @cached_property
+    def count(self):
+        if self.count_strategy is None:
+            return super().count
+        return self.count_strategy()
+
+    def order(self, queryset):
+        date_key, id_key = self.keys
+        return queryset.order_by(f'-{date_key}', f'-{id_key}')
+
+    def encode(self, obj):
+        date_key, id_key = self.keys
+        return encode_cursor(getattr(obj, date_key), getattr(obj, id_key))
+
+    def decode(self, token):
+        return decode_cursor(token)
+
+    def seek(self, queryset, cursor, older):
+        """Записи строго после (`older`) или до курсора."""
+        # Условие `date <= d AND (date < d OR id < pk)` равносильно
+        # сравнению пар, но оставляет диапазон по индексу даты.
+        date_key, id_key = self.keys
+        pub_date, pk = cursor
+        lookup = 'lt' if older else 'gt'
+        return queryset.filter(
+            Q(**{f'{date_key}__{lookup}e': pub_date}) & (
+                Q(**{f'{date_key}__{lookup}': pub_date})
+                | Q(**{f'{id_key}__{lookup}': pk})
+            )
+        )
+
+    def cursor_page(self, after=None, before=None):
+        after = after and self.decode(after)
+        before = before and self.decode(before)
+        queryset = self.object_list
+        limit = self.per_page + 1
+
+        if before and not after:
+            rows = list(
+                self.seek(queryset, before, older=False).reverse()[:limit]
+            )
+            has_previous = len(rows) > self.per_page
+            rows = rows[:self.per_page][::-1]
+            has_next = True
+        else:
+            if after:
+                queryset = self.seek(queryset, after, older=True)
+            rows = list(queryset[:limit])
+            has_next = len(rows) > self.per_page
+            rows = rows[:self.per_page]
+            has_previous = bool(after)
+
+        page = Page(rows, 1, self)
+        page.next_cursor = (
+            self.encode(rows[-1]) if rows and has_next else None
+        )
+        page.previous_cursor = (
+            self.encode(rows[0]) if rows and has_previous else None
+        )
+        return page
+
+    def cursor_for_number(self, number):
+        """Курсор, с которого начинается страница `number` (для `?page=`)."""
+        if number <= 1:
+            return None
+        offset = (number - 1) * self.per_page - 1
+        rows = list(self.object_list[offset:offset + 1])
+        if not rows:
+            return None
+        return self.encode(rows[0])
+
+
+def page_cursor(paginator, number, generation):
+    """Курсор страницы `number` для `?page=`, запомненный в кэше.
+
+    Ключ включает поколение списка (см. `posts.cache`), поэтому OFFSET
+    выполняется не чаще одного раза на страницу между записями постов.
+    """
+    sql, params = paginator.object_list.query.sql_with_params()
+    key = 'posts:page-cursor:' + hashlib.md5(
+        f'{sql}|{params}|{number}|{generation}'.encode('utf-8')
+    ).hexdigest()
+    cursor = cache.get(key)
+    if cursor is None:
+        # Пустая строка — «страницы нет», чтобы не искать её снова.
+        cursor = paginator.cursor_for_number(number) or ''
+        cache.set(key, cursor, PAGE_CURSOR_TIMEOUT)
+    return cursor or None
+
+
+def cached_count(queryset, timeout=COUNT_CACHE_TIMEOUT):
+    """Стратегия подсчёта: `COUNT(*)`, сохранённый в кэше на `timeout`.
+
+    Подходит для списков без своего счётчика: число может отставать
+    от базы на время жизни записи в кэше.
+    """
+    def count():
+        sql, params = queryset.order_by().query.sql_with_params()
+        key = 'posts:count:' + hashlib.md5(
+            f'{sql}|{params}'.encode('utf-8')
+        ).hexdigest()
+        return cache.get_or_set(key, queryset.count, timeout)
+    return count
+
+
+def follow_page_moves(view):
+    """Перенаправляет `?page=N` на эквивалентный курсорный адрес."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        try:
+            return view(request, *args, **kwargs)
+        except PageMoved as moved:
+            return redirect(moved.url, permanent=moved.permanent)
+    return wrapper
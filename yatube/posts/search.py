@@ -0,0 +1,163 @@
+"""Полнотекстовый поиск по постам на индексе SQLite FTS5.
+
+Таблица `posts_post_fts` хранит только индекс (external content) и
+обновляется триггерами на `posts_post`, поэтому в синхронизации
+участвуют и `bulk_create`, и `update()`.
+"""
+import re
+from contextlib import contextmanager
+
+from django.db import connection
+from django.db.models.expressions import RawSQL
+from django.utils.encoding import force_bytes, force_str
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
+
+from .models import Post
+from .paginators import CursorPaginator
+
+FTS_TABLE = 'posts_post_fts'
+
+INSTALL_SQL = (
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        text,
+        content='posts_post',
+        content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert
+    AFTER INSERT ON posts_post BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, text) VALUES (new.id, new.text);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete
+    AFTER DELETE ON posts_post BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, text)
+        VALUES ('delete', old.id, old.text);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update
+    AFTER UPDATE OF text ON posts_post BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, text)
+        VALUES ('delete', old.id, old.text);
+        INSERT INTO {FTS_TABLE}(rowid, text) VALUES (new.id, new.text);
+    END""",
+)
+UNINSTALL_SQL = (
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_insert',
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_delete',
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_update',
+    f'DROP TABLE IF EXISTS {FTS_TABLE}',
+)
+TERM_RE = re.compile(r'\w+')
+
+
+def install(db=connection):
+    """Создаёт индекс и триггеры, если их нет."""
+    if db.vendor != 'sqlite':
+        return
+    with db.cursor() as cursor:
+        for statement in INSTALL_SQL:
+            cursor.execute(statement)
+
+
+def restore_triggers(db=connection):
+    """Возвращает триггеры, удалённые пересозданием `posts_post`.
+
+    SQLite-миграции, меняющие `posts_post`, копируют её в новую таблицу,
+    и триггеры старой таблицы пропадают вместе с ней.
+    """
+    if db.vendor == 'sqlite' and FTS_TABLE in db.introspection.table_names():
+        install(db)
+
+
+def uninstall(db=connection):
+    if db.vendor != 'sqlite':
+        return
+    with db.cursor() as cursor:
+        for statement in UNINSTALL_SQL:
+            cursor.execute(statement)
+
+
+@contextmanager
+def deferred_index(db=connection):
+    """Отключает триггеры на время массовой загрузки и строит индекс после.
+
+    Один `rebuild` по готовой таблице быстрее, чем обновление индекса
+    на каждой вставленной строке.
+    """
+    if db.vendor != 'sqlite':
+        yield
+        return
+    with db.cursor() as cursor:
+        for statement in UNINSTALL_SQL[:-1]:
+            cursor.execute(statement)
+    try:
+        yield
+    finally:
+        install(db)
+        rebuild(db)
+
+
+def rebuild(db=connection):
+    """Заново строит индекс по содержимому `posts_post`."""
+    if db.vendor != 'sqlite':
+        return
+    with db.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"
+        )
+
+
+def match_expression(query):
+    """Запрос пользователя в виде выражения FTS5: все слова по префиксу.
+
+    Каждое слово берётся в кавычки, поэтому операторы FTS5 из
+    пользовательского ввода не интерпретируются.
+    """
+    return ' '.join(f'"{term}"*' for term in TERM_RE.findall(query))
+
+
+def matching_ids(query):
+    """Подзапрос идентификаторов постов, подходящих под запрос."""
+    return RawSQL(
+        f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+        (match_expression(query),)
+    )
+
+
+def search_posts(query, queryset=None):
+    """Посты, подходящие под запрос, с релевантностью в `rank`."""
+    queryset = Post.objects.all() if queryset is None else queryset
+    match = match_expression(query)
+    if not match:
+        return queryset.none()
+    return queryset.extra(
+        select={'rank': f'{FTS_TABLE}.rank'},
+        tables=[FTS_TABLE],
+        where=[f'{FTS_TABLE}.rowid = posts_post.id', f'{FTS_TABLE} MATCH %s'],
+        params=[match],
+    )
+
+
+class SearchPaginator(CursorPaginator):
+    """Листает результаты поиска по ключу (rank, id)."""
+
+    def order(self, queryset):
+        return queryset.order_by('rank', '-id')
+
+    def encode(self, obj):
+        return urlsafe_base64_encode(force_bytes(f'{obj.rank!r}|{obj.pk}'))
+
+    def decode(self, token):
+        try:
+            rank, pk = force_str(urlsafe_base64_decode(token)).split('|')
+            return float(rank), int(pk)
+        except (TypeError, ValueError, UnicodeDecodeError):
+            return None
+
+    def seek(self, queryset, cursor, older):
+        rank, pk = cursor
+        rank_lookup, id_lookup = ('>', '<') if older else ('<', '>')
+        condition = (
+            f'({FTS_TABLE}.rank {rank_lookup} %s OR '
+            f'({FTS_TABLE}.rank = %s AND posts_post.id {id_lookup} %s))'
+        )
+        return queryset.extra(where=[condition], params=[rank, rank, pk])
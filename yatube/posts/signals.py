@@ -0,0 +1,223 @@
+from django.db.models import F
+from django.core.files.images import get_image_dimensions
+from django.db.models.signals import (post_delete, post_init, post_save,
+                                      pre_delete, pre_save)
+from django.dispatch import receiver
+
+from . import blobs, counters, feed, thumbnails
+from .cache import COMMENTS_GENERATION_KEY, bump_generation
+from .models import (Comment, Follow, Group, Post, PostCounter, User,
+                     UserCounters)
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        feed.fan_out(instance)
+
+
+@receiver(post_save, sender=Follow)
+def follow_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        feed.backfill(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    feed.trim(instance.user_id, instance.author_id)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+@receiver(post_delete, sender=User)
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def invalidate_pages(sender, **kwargs):
+    bump_generation()
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, update_fields=None, **kwargs):
+    if update_fields and set(update_fields) == {'last_login'}:
+        return
+    bump_generation()
+
+
+@receiver(post_save, sender=User)
+def user_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        UserCounters.objects.get_or_create(user=instance)
+
+
+@receiver(post_save, sender=Post)
+def count_new_post(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.change_user_counters(instance.author_id, posts_count=1)
+
+
+@receiver(post_delete, sender=Post)
+def count_deleted_post(sender, instance, **kwargs):
+    counters.change_user_counters(instance.author_id, posts_count=-1)
+
+
+@receiver(post_init, sender=Post)
+def remember_group(sender, instance, **kwargs):
+    # Группа при загрузке: по ней видно, что правка перенесла пост.
+    # Через __dict__, чтобы не загружать отложенное поле.
+    instance._counted_group_id = instance.__dict__.get('group_id')
+
+
+@receiver(post_save, sender=Post)
+def count_post_in_groups(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        counters.change_post_counters(instance.group_id, 1)
+    elif instance.group_id != instance._counted_group_id:
+        counters.change_post_counters(
+            instance._counted_group_id, -1, total=False
+        )
+        counters.change_post_counters(instance.group_id, 1, total=False)
+    instance._counted_group_id = instance.group_id
+
+
+@receiver(post_delete, sender=Post)
+def uncount_post_in_groups(sender, instance, **kwargs):
+    counters.change_post_counters(instance.group_id, -1)
+
+
+@receiver(post_delete, sender=Group)
+def drop_group_counter(sender, instance, **kwargs):
+    PostCounter.objects.filter(
+        scope=counters.group_scope(instance.pk)
+    ).delete()
+
+
+@receiver(post_save, sender=Comment)
+def count_new_comment(sender, instance, created, raw=False, **kwargs):
+    if created and not raw and instance.post_id:
+        counters.change_comments_count(instance.post_id, 1)
+
+
+@receiver(post_delete, sender=Comment)
+def count_deleted_comment(sender, instance, **kwargs):
+    if instance.post_id:
+        counters.change_comments_count(instance.post_id, -1)
+
+
+@receiver(post_save, sender=Follow)
+def count_new_follow(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.change_user_counters(instance.author_id, followers_count=1)
+        counters.change_user_counters(instance.user_id, following_count=1)
+
+
+@receiver(post_delete, sender=Follow)
+def count_deleted_follow(sender, instance, **kwargs):
+    counters.change_user_counters(instance.author_id, followers_count=-1)
+    counters.change_user_counters(instance.user_id, following_count=-1)
+
+
+@receiver(post_save, sender=Post)
+def post_changed(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw:
+        Post.objects.filter(pk=instance.pk).update(version=F('version') + 1)
+        # Иначе в экземпляре остаётся прежняя версия, и ETag,
+        # посчитанный по нему, совпал бы с уже отданным.
+        instance.refresh_from_db(fields=['version'])
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def comment_changed(sender, instance, raw=False, **kwargs):
+    if not raw and instance.post_id:
+        Post.objects.filter(pk=instance.post_id).update(
+            version=F('version') + 1
+        )
+        bump_generation(COMMENTS_GENERATION_KEY)
+
+
+@receiver(post_save, sender=Group)
+def group_changed(sender, instance, created, raw=False, **kwargs):
+    # Название и адрес группы есть в карточках её постов.
+    if not created and not raw:
+        Post.objects.filter(group=instance).update(version=F('version') + 1)
+
+
+@receiver(pre_delete, sender=Group)
+def group_deleted(sender, instance, **kwargs):
+    # SET_NULL обнуляет group_id одним UPDATE без сигналов постов.
+    Post.objects.filter(group=instance).update(version=F('version') + 1)
+
+
+# Поля автора, которые видны в карточках его постов.
+AUTHOR_CARD_FIELDS = ('username', 'first_name', 'last_name')
+
+
+def _author_card(instance):
+    # Через __dict__, чтобы не загружать отложенные поля.
+    return tuple(instance.__dict__.get(name) for name in AUTHOR_CARD_FIELDS)
+
+
+@receiver(post_init, sender=User)
+def remember_author_card(sender, instance, **kwargs):
+    instance._initial_card = _author_card(instance)
+
+
+@receiver(post_save, sender=User)
+def author_changed(sender, instance, created, raw=False, **kwargs):
+    card = _author_card(instance)
+    if created or raw or card == instance._initial_card:
+        return
+    instance._initial_card = card
+    Post.objects.filter(author=instance).update(version=F('version') + 1)
+
+
+def _image_name(instance):
+    # Через __dict__, чтобы не загружать отложенное поле.
+    image = instance.__dict__.get('image')
+    return getattr(image, 'name', image) or ''
+
+
+@receiver(post_init, sender=Post)
+def remember_image(sender, instance, **kwargs):
+    instance._initial_image = _image_name(instance)
+
+
+@receiver(post_save, sender=Post)
+def image_changed(sender, instance, raw=False, **kwargs):
+    name = _image_name(instance)
+    if raw or name == instance._initial_image:
+        return
+    if instance._initial_image:
+        blobs.release(instance._initial_image)
+    if name:
+        blobs.retain(name)
+        thumbnails.queue_thumbnails(name)
+    instance._initial_image = name
+
+
+@receiver(post_delete, sender=Post)
+def image_released(sender, instance, **kwargs):
+    if instance._initial_image:
+        blobs.release(instance._initial_image)
+
+
+@receiver(pre_save, sender=Post)
+def store_image_dimensions(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    image = instance.image
+    if not image:
+        instance.image_width = instance.image_height = None
+    elif not image._committed:
+        # Файл ещё не в хранилище: размеры читаются из загрузки, а
+        # картинку, проверенную формой, Pillow повторно не открывает.
+        checked = getattr(image.file, 'image', None)
+        if checked is not None:
+            size = checked.size
+        else:
+            size = get_image_dimensions(image.file)
+        instance.image_width, instance.image_height = size
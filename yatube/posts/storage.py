@@ -0,0 +1,57 @@
+"""Хранилище картинок постов, называющее файлы по хешу содержимого.
+
+Одинаковая картинка, загруженная многими пользователями, хранится один
+раз: `posts/ab/abcdef….gif`, где имя — SHA-256 содержимого. Миниатюры
+sorl-thumbnail и варианты для `srcset` строятся по имени исходного
+файла, поэтому у дубликатов они тоже общие. Сколько постов ссылается
+на файл, считают сигналы (см. `posts.blobs`).
+
+Хеш считают обработчики загрузки из `posts.uploads` по мере получения
+данных; для остальных файлов он вычисляется при сохранении.
+"""
+import hashlib
+import os
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+HASH_CHUNK_SIZE = 64 * 2 ** 10
+
+
+def content_hash(content):
+    """SHA-256 содержимого: готовый от обработчика загрузки или заново."""
+    digest = getattr(content, 'content_hash', None)
+    if digest:
+        return digest
+    hasher = hashlib.sha256()
+    for chunk in content.chunks(HASH_CHUNK_SIZE):
+        hasher.update(chunk)
+    content.seek(0)
+    return hasher.hexdigest()
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """`FileSystemStorage`, который не сохраняет один файл дважды."""
+
+    def hashed_name(self, name, digest):
+        directory = os.path.dirname(name)
+        extension = os.path.splitext(name)[1].lower()
+        return os.path.join(directory, digest[:2], f'{digest}{extension}')
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.hashed_name(name, content_hash(content))
+        if self.exists(name):
+            # Свежее время изменения не даёт сборщику мусора удалить
+            # файл, пока пост с ним ещё не сохранён.
+            os.utime(self.path(name))
+            return name
+        # Если тот же файл одновременно сохраняет другой процесс,
+        # FileSystemStorage выберет имя с суффиксом: дубликат возможен,
+        # но ни один из двух файлов не будет испорчен.
+        return self._save(name, content)
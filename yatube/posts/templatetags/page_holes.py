@@ -0,0 +1,22 @@
+"""Тег `{% hole %}` для частей страницы, зависящих от пользователя.
+
+При отрисовке общей оболочки для кэша тег оставляет метку, которую
+`posts.holes.fill_holes` заполнит для каждого запроса, в остальных
+случаях сразу отрисовывает фрагмент.
+"""
+from django import template
+from django.utils.safestring import mark_safe
+
+from posts.holes import placeholder, render_hole
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def hole(context, name, **params):
+    request = context['request']
+    params = {key: str(value) for key, value in params.items()}
+    nonce = getattr(request, 'page_shell', None)
+    if nonce:
+        return mark_safe(placeholder(nonce, name, params))
+    return mark_safe(render_hole(request, name, params))
@@ -0,0 +1,20 @@
+from django import template
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def cursor_url(context, param=None, cursor=None):
+    """Адрес текущей страницы с курсором `param` и прочими параметрами.
+
+    Без `param` — адрес первой страницы с теми же параметрами.
+    """
+    request = context['request']
+    query = request.GET.copy()
+    for name in ('after', 'before', 'page'):
+        query.pop(name, None)
+    if param:
+        query[param] = cursor
+    if not query:
+        return request.path
+    return f'{request.path}?{query.urlencode()}'
@@ -0,0 +1,74 @@
+"""Карточки постов с кэшем фрагментов, общим для всех пользователей.
+
+Ключ карточки включает `Post.version`, которую сигналы увеличивают
+при изменении поста, его группы или автора, поэтому устаревшие
+карточки не удаляются, а просто перестают запрашиваться.
+"""
+from django import template
+from django.core.cache import cache
+from django.db.models import prefetch_related_objects
+from django.template.loader import get_template
+from django.utils.safestring import mark_safe
+
+from posts.thumbnails import (FALLBACK_GEOMETRY, FALLBACK_OPTIONS,
+                              StoredImage, pending_names, resolve_thumbnails)
+
+register = template.Library()
+
+CARD_TEMPLATE = 'posts/includes/post_card.html'
+CARD_TIMEOUT = 60 * 60 * 24
+
+
+def card_key(post):
+    return f'posts:card:{post.pk}:{post.version}'
+
+
+@register.simple_tag
+def post_cards(posts):
+    """HTML карточек постов страницы в том же порядке.
+
+    Готовые карточки читаются одним `get_many`, недостающие
+    отрисовываются и сохраняются одним `set_many`.
+    """
+    posts = list(posts)
+    keys = [card_key(post) for post in posts]
+    cards = cache.get_many(keys)
+    missing = {key: post for key, post in zip(keys, posts)
+               if key not in cards}
+    # Варианты картинок нужны только отрисовываемым карточкам.
+    prefetch_related_objects(
+        [post for post in missing.values() if post.image], 'image_variants'
+    )
+    thumbnails = fallback_thumbnails(missing.values())
+    card_template = get_template(CARD_TEMPLATE)
+    for key, post in missing.items():
+        missing[key] = cards[key] = card_template.render({
+            'post': post, 'thumbnail': thumbnails.get(post.pk),
+        })
+    if missing:
+        cache.set_many(missing, CARD_TIMEOUT)
+    return [mark_safe(cards[key]) for key in keys]
+
+
+def fallback_thumbnails(posts):
+    """Миниатюры картинок без вариантов для всех карточек сразу.
+
+    Вместо запроса к кэшу на каждый тег `thumbnail` — один `get_many`
+    для отметок «готовится» и один для хранилища ключей sorl.
+    """
+    posts = [
+        post for post in posts
+        if post.image and not post.image_variants.all()
+    ]
+    pending = pending_names([post.image.name for post in posts])
+    ready = resolve_thumbnails(
+        [post.image for post in posts if post.image.name not in pending],
+        FALLBACK_GEOMETRY, **FALLBACK_OPTIONS
+    )
+    thumbnails = {}
+    for post in posts:
+        if post.image.name in pending:
+            thumbnails[post.pk] = StoredImage(post.image)
+        elif post.image.name in ready:
+            thumbnails[post.pk] = ready[post.image.name]
+    return thumbnails
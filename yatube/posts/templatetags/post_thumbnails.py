@@ -0,0 +1,55 @@
+"""Картинки постов: варианты для `srcset` и тег `thumbnail`.
+
+`thumbnail` заменяет одноимённый тег sorl-thumbnail: пока копии
+картинки готовятся в фоне (см. `posts.thumbnails`), вместо миниатюры
+подставляется исходная картинка.
+"""
+from django import template
+from sorl.thumbnail.templatetags.thumbnail import ThumbnailNode
+
+from posts.models import PostImageVariant
+from posts.thumbnails import StoredImage, is_pending
+
+register = template.Library()
+
+
+class PreparedThumbnailNode(ThumbnailNode):
+    def _render(self, context):
+        file_ = self.file_.resolve(context)
+        if not (file_ and is_pending(file_.name)):
+            return super()._render(context)
+        if not self.as_var:
+            return file_.url
+        with context.push(**{self.as_var: StoredImage(file_)}):
+            return self.nodelist_file.render(context)
+
+
+@register.tag
+def thumbnail(parser, token):
+    return PreparedThumbnailNode(parser, token)
+
+
+def _srcset(variants):
+    return ', '.join(
+        f'{variant.image.url} {variant.width}w' for variant in variants
+    )
+
+
+@register.inclusion_tag('posts/includes/post_image.html', takes_context=True)
+def post_image(context, post, sizes):
+    """`<picture>` с вариантами картинки поста для ширины `sizes`.
+
+    Пока вариантов нет, шаблон показывает миниатюру sorl-thumbnail:
+    заранее найденную (`thumbnail` в контексте) или через тег.
+    """
+    variants = list(post.image_variants.all()) if post.image else []
+    jpeg = [v for v in variants if v.format == PostImageVariant.JPEG]
+    webp = [v for v in variants if v.format == PostImageVariant.WEBP]
+    return {
+        'post': post,
+        'sizes': sizes,
+        'thumbnail': context.get('thumbnail'),
+        'fallback': jpeg[-1] if jpeg else None,
+        'jpeg_srcset': _srcset(jpeg),
+        'webp_srcset': _srcset(webp),
+    }
@@ -1,12 +1,17 @@
 # posts/tests/test_forms.py
+import hashlib
 import shutil
 import tempfile
+from io import BytesIO
+from unittest import mock
 
 from django.conf import settings
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
+from PIL import Image
 from posts.models import Comment, Group, Post, User
+from posts.tests.test_models import SMALL_GIF
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
@@ -27,19 +32,13 @@ class PostCreateFormTests(TestCase):
             username='hasNoName',
             password='test'
         )
-        small_gif = (
-            b'\x47\x49\x46\x38\x39\x61\x02\x00'
-            b'\x01\x00\x80\x00\x00\x00\x00\x00'
-            b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
-            b'\x00\x00\x00\x2C\x00\x00\x00\x00'
-            b'\x02\x00\x01\x00\x00\x02\x02\x0C'
-            b'\x0A\x00\x3B'
-        )
         cls.img_uploaded = SimpleUploadedFile(
             name='small.gif',
-            content=small_gif,
+            content=SMALL_GIF,
             content_type='image/gif'
         )
+        digest = hashlib.sha256(SMALL_GIF).hexdigest()
+        cls.img_name = f'posts/{digest[:2]}/{digest}.gif'
 
     @classmethod
     def tearDownClass(cls):
@@ -77,7 +76,7 @@ class PostCreateFormTests(TestCase):
                 text=form_data['text'],
                 author=PostCreateFormTests.author_user,
                 group=form_data['group'],
-                image=f"posts/{form_data['image']}"
+                image=PostCreateFormTests.img_name
             ).exists()
         )
         self.assertTrue(
@@ -86,7 +85,7 @@ class PostCreateFormTests(TestCase):
                 text=form_data['text'],
                 author=PostCreateFormTests.author_user,
                 group=form_data['group'],
-                image=f"posts/{form_data['image']}"
+                image=PostCreateFormTests.img_name
             )
         )
         latest_object = Post.objects.latest('pub_date')
@@ -94,7 +93,7 @@ class PostCreateFormTests(TestCase):
             (
                 latest_object.text == form_data['text']
                 and latest_object.group.pk == form_data['group']
-                and latest_object.image == f"posts/{form_data['image']}")
+                and latest_object.image == PostCreateFormTests.img_name)
         )
 
 
@@ -172,6 +171,84 @@ class PostEditFormTests(TestCase):
         )
 
 
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ImageUploadLimitsTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author_user = User.objects.create_user(username='uploader')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.client.force_login(ImageUploadLimitsTests.author_user)
+
+    def upload(self, content, name='upload.png'):
+        return self.client.post(reverse('posts:post_create'), data={
+            'text': 'Пост с картинкой',
+            'image': SimpleUploadedFile(name, content),
+        })
+
+    def image(self, image_format='PNG', size=(4, 4)):
+        buffer = BytesIO()
+        Image.new('RGB', size).save(buffer, image_format)
+        return buffer.getvalue()
+
+    def assertRejected(self, response, error):
+        self.assertEqual(response.status_code, 200)
+        self.assertFormError(response, 'form', 'image', error)
+        self.assertFalse(Post.objects.exists())
+
+    def test_valid_image_accepted(self):
+        """Картинка в пределах ограничений сохраняется"""
+        self.upload(self.image())
+        self.assertEqual(Post.objects.get().image_width, 4)
+
+    @override_settings(IMAGE_UPLOAD_MAX_SIZE=2 ** 20)
+    def test_oversized_file_rejected(self):
+        """Файл больше допустимого не сохраняется целиком"""
+        response = self.upload(b'x' * (2 ** 20 + 1))
+        self.assertRejected(response, 'Файл больше 1 МБ')
+
+    @override_settings(IMAGE_UPLOAD_MAX_PIXELS=10 ** 6)
+    def test_too_many_pixels_rejected(self):
+        """Картинка с большим числом пикселей отклоняется по заголовку"""
+        content = self.image(size=(1001, 1000))
+        with mock.patch.object(Image.Image, 'load') as load:
+            response = self.upload(content)
+        load.assert_not_called()
+        self.assertRejected(
+            response,
+            'Картинка 1001x1000 слишком большая: допускается не больше '
+            '1 Мпикс',
+        )
+
+    def test_format_and_content_checked(self):
+        """Отклоняются чужие форматы и файлы, не являющиеся картинками"""
+        self.assertRejected(
+            self.upload(self.image('BMP'), 'picture.bmp'),
+            'Допустимые форматы картинок: JPEG, PNG, GIF, WEBP',
+        )
+        self.assertRejected(
+            self.upload(b'not an image', 'fake.png'),
+            'Файл не является картинкой',
+        )
+
+    def test_csrf_checked_after_handlers_set(self):
+        """Форма поста с проверкой загрузок по-прежнему требует CSRF"""
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(ImageUploadLimitsTests.author_user)
+        response = client.post(reverse('posts:post_create'), data={
+            'text': 'Пост без токена',
+            'image': SimpleUploadedFile('upload.png', self.image()),
+        })
+        self.assertTemplateUsed(response, 'core/403csrf.html')
+        self.assertFalse(Post.objects.exists())
+
+
 class PostCommentFormTests(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -1,11 +1,36 @@
 # posts/tests/test_models.py
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from sorl.thumbnail import get_thumbnail
 
-from ..models import Group, Post
+from ..blobs import rebuild_image_references
+from ..counters import posts_total
+from ..forms import PostForm
+from ..models import (Comment, FeedEntry, Follow, Group, ImageBlob, Post,
+                      PostCounter, UserCounters)
+from ..search import search_posts
 
 User = get_user_model()
 
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
 
 class PostModelTest(TestCase):
     @classmethod
@@ -65,3 +90,268 @@ class PostModelTest(TestCase):
             with self.subTest(field=field):
                 self.assertEqual(
                     post._meta.get_field(field).help_text, expected_value)
+
+
+class CountersTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+
+    def test_post_and_comment_counters(self):
+        """Счётчики постов и комментариев меняются вместе с записями."""
+        post = Post.objects.create(author=CountersTest.author, text='Пост')
+        comment = Comment.objects.create(
+            post=post, author=CountersTest.reader, text='Комментарий'
+        )
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(
+            UserCounters.objects.get(user=CountersTest.author).posts_count, 1
+        )
+        comment.delete()
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 0)
+        post.delete()
+        self.assertEqual(
+            UserCounters.objects.get(user=CountersTest.author).posts_count, 0
+        )
+
+    def test_saved_instance_has_current_version(self):
+        """После сохранения экземпляр знает новую версию поста"""
+        post = Post.objects.create(author=CountersTest.author, text='Пост')
+        versions = []
+        for text in ('Первая правка', 'Вторая правка'):
+            post.text = text
+            post.save()
+            versions.append(post.version)
+            self.assertEqual(
+                post.version, Post.objects.get(pk=post.pk).version
+            )
+        self.assertGreater(versions[1], versions[0])
+
+    def test_edit_keeps_concurrent_counters(self):
+        """Сохранение старого экземпляра не откатывает счётчики"""
+        post = Post.objects.create(author=CountersTest.author, text='Пост')
+        post.refresh_from_db()
+        editing = Post.objects.get(pk=post.pk)
+        Comment.objects.create(
+            post=post, author=CountersTest.reader, text='Комментарий'
+        )
+        post.refresh_from_db()
+        form = PostForm(data={'text': 'Исправленный'}, instance=editing)
+        self.assertTrue(form.is_valid())
+        form.save()
+        edited = Post.objects.get(pk=post.pk)
+        self.assertEqual(edited.text, 'Исправленный')
+        self.assertEqual(edited.comments_count, 1)
+        self.assertGreater(edited.version, post.version)
+
+    def test_follow_counters(self):
+        """Счётчики подписок меняются при подписке и отписке."""
+        follow = Follow.objects.create(
+            user=CountersTest.reader, author=CountersTest.author
+        )
+        self.assertEqual(
+            UserCounters.objects.get(user=CountersTest.author).followers_count,
+            1
+        )
+        self.assertEqual(
+            UserCounters.objects.get(user=CountersTest.reader).following_count,
+            1
+        )
+        follow.delete()
+        self.assertEqual(
+            UserCounters.objects.get(user=CountersTest.author).followers_count,
+            0
+        )
+
+    def test_post_counters(self):
+        """Общее число постов и число постов в группах следуют за постами."""
+        first, second = (
+            Group.objects.create(title=slug, slug=slug, description='')
+            for slug in ('first', 'second')
+        )
+        post = Post.objects.create(
+            author=CountersTest.author, text='Пост', group=first
+        )
+        self.assertEqual(posts_total(), 1)
+        self.assertEqual(posts_total(first.pk), 1)
+        post = Post.objects.get(pk=post.pk)
+        post.group = second
+        post.save()
+        self.assertEqual(posts_total(first.pk), 0)
+        self.assertEqual(posts_total(second.pk), 1)
+        self.assertEqual(posts_total(), 1)
+        post.delete()
+        self.assertEqual(posts_total(), 0)
+        self.assertEqual(posts_total(second.pk), 0)
+
+    def test_rebuild_counters_command(self):
+        """Команда rebuild_counters восстанавливает счётчики."""
+        post = Post.objects.create(author=CountersTest.author, text='Пост')
+        Comment.objects.create(
+            post=post, author=CountersTest.reader, text='Комментарий'
+        )
+        UserCounters.objects.update(posts_count=0)
+        Post.objects.update(comments_count=0)
+        PostCounter.objects.update(posts_count=0)
+        call_command('rebuild_counters', stdout=StringIO())
+        self.assertEqual(posts_total(), 1)
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(
+            UserCounters.objects.get(user=CountersTest.author).posts_count, 1
+        )
+
+
+class MediaTestCase(TestCase):
+    """Посты с картинками во временном MEDIA_ROOT, своём у каждого класса."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.media_settings = override_settings(
+            MEDIA_ROOT=tempfile.mkdtemp(dir=settings.BASE_DIR)
+        )
+        cls.media_settings.enable()
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+        cls.media_settings.disable()
+
+    def create_post(self, content, name='meme.gif'):
+        post = Post(author=self.author, text='Пост')
+        post.image.save(name, ContentFile(content), save=False)
+        post.save()
+        return post
+
+
+class ImageBlobTest(MediaTestCase):
+    def references(self, name):
+        return ImageBlob.objects.get(name=name).references
+
+    def test_duplicates_stored_once(self):
+        """Одинаковые картинки хранятся одним файлом с числом ссылок"""
+        first = self.create_post(b'same', 'first.gif')
+        second = self.create_post(b'same', 'second.GIF')
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertRegex(first.image.name, r'^posts/\w\w/\w{64}\.gif$')
+        directory = os.path.dirname(first.image.path)
+        self.assertEqual(len(os.listdir(directory)), 1)
+        self.assertEqual(self.references(first.image.name), 2)
+
+    def test_references_follow_posts(self):
+        """Ссылки уменьшаются при удалении поста и замене картинки"""
+        first = self.create_post(b'shared')
+        second = self.create_post(b'shared')
+        name = first.image.name
+        first.delete()
+        self.assertEqual(self.references(name), 1)
+        second.image.save('other.gif', ContentFile(b'other'))
+        self.assertEqual(self.references(name), 0)
+        self.assertEqual(self.references(second.image.name), 1)
+        ImageBlob.objects.update(references=7)
+        rebuild_image_references()
+        self.assertEqual(self.references(name), 0)
+        self.assertEqual(self.references(second.image.name), 1)
+
+
+class MediaGarbageTest(MediaTestCase):
+    def collect(self, **options):
+        options.setdefault('min_age', 0)
+        call_command('collect_media_garbage', stdout=StringIO(), **options)
+
+    def test_orphans_removed(self):
+        """Удаляются картинки без постов и миниатюры без картинок"""
+        kept = self.create_post(b'kept')
+        deleted = self.create_post(SMALL_GIF)
+        thumbnail = get_thumbnail(deleted.image, '50x50').name
+        stray = default_storage.save('cache/ab/stray.jpg', ContentFile(b'x'))
+        deleted.delete()
+        files = [deleted.image.name, thumbnail, stray]
+        self.collect(dry_run=True)
+        for name in files:
+            self.assertTrue(default_storage.exists(name), name)
+        self.collect()
+        for name in files:
+            self.assertFalse(default_storage.exists(name), name)
+        self.assertTrue(default_storage.exists(kept.image.name))
+        self.assertFalse(
+            ImageBlob.objects.filter(name=deleted.image.name).exists()
+        )
+
+    def test_candidates_from_reference_counts(self):
+        """Картинки без ссылок находятся по счётчикам, остальные — обходом"""
+        deleted = self.create_post(b'deleted')
+        deleted.delete()
+        drifted = self.create_post(b'drifted')
+        ImageBlob.objects.filter(name=drifted.image.name).update(references=0)
+        legacy = default_storage.save('posts/legacy.gif', ContentFile(b'x'))
+        output = StringIO()
+        call_command('collect_media_garbage', min_age=0, stdout=output)
+        self.assertIn(
+            'Картинки без ссылок: просмотрено 2, удалено 1', output.getvalue()
+        )
+        self.assertIn(
+            'Файлы вне счётчиков ссылок: просмотрено 2, удалено 1',
+            output.getvalue(),
+        )
+        self.assertFalse(default_storage.exists(deleted.image.name))
+        self.assertFalse(default_storage.exists(legacy))
+        self.assertTrue(default_storage.exists(drifted.image.name))
+        self.assertTrue(
+            ImageBlob.objects.filter(name=drifted.image.name).exists()
+        )
+
+    def test_recent_files_kept(self):
+        """Недавно изменённые файлы не удаляются"""
+        post = self.create_post(b'recent')
+        post.delete()
+        self.collect(min_age=60)
+        self.assertTrue(default_storage.exists(post.image.name))
+
+    def test_checkpoint_resumes(self):
+        """Запуск продолжается с сохранённой позиции"""
+        post = self.create_post(b'before checkpoint')
+        post.delete()
+        checkpoint = os.path.join(settings.MEDIA_ROOT, 'gc.json')
+        with open(checkpoint, 'w') as file:
+            json.dump({'phase': 'thumbnails', 'after': None}, file)
+        self.collect(checkpoint=checkpoint)
+        self.assertTrue(default_storage.exists(post.image.name))
+        self.assertFalse(os.path.exists(checkpoint))
+
+
+class SeedCommandTest(TestCase):
+    def test_seed_command(self):
+        """Команда seed создаёт связанные данные с верными счётчиками."""
+        call_command(
+            'seed', users=20, groups=3, posts=200, comments=100,
+            follows=5, batch_size=50, seed=1, stdout=StringIO(),
+        )
+        self.assertEqual(Post.objects.count(), 200)
+        self.assertEqual(Comment.objects.count(), 100)
+        self.assertTrue(Follow.objects.exists())
+        follow = Follow.objects.select_related('author').first()
+        self.assertEqual(
+            FeedEntry.objects.filter(user=follow.user).count(),
+            Post.objects.filter(
+                author__following__user=follow.user
+            ).count()
+        )
+        counters = UserCounters.objects.get(user=follow.author)
+        self.assertEqual(
+            counters.posts_count,
+            Post.objects.filter(author=follow.author).count()
+        )
+        self.assertEqual(
+            counters.followers_count,
+            Follow.objects.filter(author=follow.author).count()
+        )
+        post = Post.objects.order_by('?').first()
+        self.assertTrue(search_posts(post.text.split()[0]).exists())
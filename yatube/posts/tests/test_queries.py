@@ -0,0 +1,251 @@
+# posts/tests/test_queries.py
+import json
+import os
+import re
+import tempfile
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from posts.models import Comment, Follow, Group, Post, User
+from posts.paginators import encode_cursor
+
+BAD_PLAN = re.compile(r'^SCAN (TABLE )?posts_\w+$|TEMP B-TREE')
+
+
+class QueryRecorder:
+    """Запоминает SQL и параметры всех запросов внутри блока."""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries.append((sql, params))
+        return execute(sql, params, many, context)
+
+    def __enter__(self):
+        self._wrapper = connection.execute_wrapper(self)
+        self._wrapper.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._wrapper.__exit__(*exc_info)
+
+
+class QueryBudgetMixin:
+    """Проверка, что число запросов страницы не растёт вместе с данными.
+
+    `add_rows(amount)` добавляет строки, которые попадут на страницу.
+    Страница открывается с `rows` и с `rows * factor` строками, и число
+    запросов в обоих случаях должно совпасть.
+    """
+
+    def count_queries(self, client, url):
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def assertQueryBudget(self, client, url, add_rows, rows=1, factor=10):
+        add_rows(rows)
+        small = self.count_queries(client, url)
+        add_rows(rows * factor - rows)
+        large = self.count_queries(client, url)
+        self.assertEqual(
+            small, large,
+            f'{url}: {small} запросов для {rows} строк и {large} '
+            f'для {rows * factor}'
+        )
+
+
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.reader = User.objects.create_user(username='reader')
+        self.client = Client()
+        self.client.force_login(self.reader)
+        self.created = 0
+
+    def add_posts(self, amount, author=None, group=None, follow=False):
+        for _ in range(amount):
+            self.created += 1
+            post_author = author or User.objects.create_user(
+                username=f'author{self.created}'
+            )
+            if follow and not author:
+                Follow.objects.create(user=self.reader, author=post_author)
+            Post.objects.create(
+                text=f'Пост {self.created}',
+                author=post_author,
+                group=group or Group.objects.create(
+                    title=f'Группа {self.created}',
+                    slug=f'group-{self.created}',
+                    description='Описание',
+                ),
+            )
+
+    def test_index_query_budget(self):
+        """Главная страница не делает запросов на каждый пост"""
+        self.assertQueryBudget(
+            self.client, reverse('posts:index'), self.add_posts
+        )
+
+    def test_group_query_budget(self):
+        """Страница группы не делает запросов на каждый пост"""
+        group = Group.objects.create(
+            title='Группа', slug='budget', description='Описание'
+        )
+        self.assertQueryBudget(
+            self.client,
+            reverse('posts:group_list', kwargs={'slug': group.slug}),
+            lambda amount: self.add_posts(amount, group=group),
+        )
+
+    def test_profile_query_budget(self):
+        """Страница автора не делает запросов на каждый пост"""
+        author = User.objects.create_user(username='prolific')
+        self.assertQueryBudget(
+            self.client,
+            reverse('posts:profile', kwargs={'username': author.username}),
+            lambda amount: self.add_posts(amount, author=author),
+        )
+
+    def test_follow_index_query_budget(self):
+        """Лента подписок не делает запросов на каждый пост"""
+        self.assertQueryBudget(
+            self.client,
+            reverse('posts:follow_index'),
+            lambda amount: self.add_posts(amount, follow=True),
+        )
+
+    def test_post_detail_query_budget(self):
+        """Страница поста не делает запросов на каждый комментарий"""
+        post = Post.objects.create(text='Пост', author=self.reader)
+
+        def add_comments(amount):
+            for _ in range(amount):
+                self.created += 1
+                Comment.objects.create(
+                    post=post,
+                    text='Комментарий',
+                    author=User.objects.create_user(
+                        username=f'commenter{self.created}'
+                    ),
+                )
+
+        self.assertQueryBudget(
+            self.client,
+            reverse('posts:post_detail', kwargs={'post_id': post.pk}),
+            add_comments,
+        )
+
+
+class QueryPlanTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.group = Group.objects.create(
+            title='Группа',
+            slug='plan-group',
+            description='Описание',
+        )
+        cls.author = User.objects.create_user(username='planner')
+        cls.reader = User.objects.create_user(username='reader')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        for i in range(3):
+            post = Post.objects.create(
+                text=f'Пост {i}', author=cls.author, group=cls.group
+            )
+            Comment.objects.create(
+                post=post, author=cls.reader, text='Комментарий'
+            )
+        cls.post = post
+        cls.cursor = encode_cursor(post.pub_date, post.pk)
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(QueryPlanTests.reader)
+
+    def plan(self, sql, params):
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            return [row[-1] for row in cursor.fetchall()]
+
+    def test_views_use_indexes(self):
+        """Запросы страниц постов идут по индексам без сортировки"""
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list',
+                    kwargs={'slug': QueryPlanTests.group.slug}),
+            reverse('posts:profile',
+                    kwargs={'username': QueryPlanTests.author.username}),
+            reverse('posts:post_detail',
+                    kwargs={'post_id': QueryPlanTests.post.pk}),
+            reverse('posts:follow_index'),
+        )
+        for url in urls:
+            for query in ({}, {'after': QueryPlanTests.cursor},
+                          {'before': QueryPlanTests.cursor}):
+                cache.clear()
+                with QueryRecorder() as recorder:
+                    response = self.client.get(url, query)
+                self.assertEqual(response.status_code, 200)
+                for sql, params in recorder.queries:
+                    if not sql.startswith('SELECT') or 'posts_' not in sql:
+                        continue
+                    for detail in self.plan(sql, params):
+                        with self.subTest(url=url, query=query, sql=sql):
+                            self.assertIsNone(BAD_PLAN.search(detail), detail)
+
+
+class BenchmarkViewsCommandTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        call_command(
+            'seed', users=5, groups=2, posts=30, comments=10, seed=1,
+            stdout=StringIO(),
+        )
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.output = os.path.join(directory.name, 'benchmark.json')
+
+    def benchmark(self, **options):
+        call_command(
+            'benchmark_views', requests=3, warmup=0, output=self.output,
+            stdout=StringIO(), **options
+        )
+        with open(self.output, encoding='utf-8') as source:
+            return json.load(source)
+
+    def test_report(self):
+        """Бенчмарк сохраняет метрики всех страниц и не меняет базу"""
+        posts = Post.objects.count()
+        report = self.benchmark()
+        self.assertEqual(Post.objects.count(), posts)
+        self.assertEqual(len(report['results']), 7)
+        for name, result in report['results'].items():
+            with self.subTest(view=name):
+                self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+                self.assertGreater(result['queries'], 0)
+                self.assertGreaterEqual(result['db_ms'], 0)
+        self.assertGreater(report['results']['index']['template_ms'], 0)
+
+    def test_regression_against_baseline(self):
+        """Рост числа запросов относительно базового прогона — ошибка"""
+        report = self.benchmark(views=['index'])
+        report['results']['index']['queries'] /= 2
+        with open(self.output, 'w', encoding='utf-8') as target:
+            json.dump(report, target)
+        with self.assertRaisesMessage(CommandError, 'index: queries'):
+            call_command(
+                'benchmark_views', requests=3, warmup=0, views=['index'],
+                baseline=self.output, stdout=StringIO(),
+            )
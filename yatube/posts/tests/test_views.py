@@ -2,16 +2,36 @@
 import shutil
 import tempfile
 from datetime import datetime
+from io import BytesIO, StringIO
+from itertools import product
+from unittest import mock
 
 from django.conf import settings
+from django.contrib import admin
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
 from django.core.paginator import Page
+from django.db import connection
 from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from PIL import Image, features
+from sorl.thumbnail import get_thumbnail
+
+from posts import cache as page_cache
+from posts import thumbnails, variants
+from posts.counters import rebuild_post_counters
 from posts.forms import PostForm
-from posts.models import Follow, Group, Post, User
+from posts.holes import fill_holes, placeholder
+from posts.models import (Comment, FeedEntry, Follow, Group, Post,
+                          PostCounter, User)
+from posts.templatetags.post_cards import card_key
+from posts.tests.test_models import SMALL_GIF
+from posts.thumbnails import (FALLBACK_GEOMETRY, FALLBACK_OPTIONS, generate,
+                              is_pending, resolve_thumbnails)
+from posts.variants import variant_widths
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 User = get_user_model()
@@ -30,17 +50,9 @@ class PostsViewsTests(TestCase):
         )
         cls.author_user = User.objects.create_user(username='hasNoName')
         cls.follower_user = User.objects.create_user(username='Follower')
-        small_gif = (
-            b'\x47\x49\x46\x38\x39\x61\x02\x00'
-            b'\x01\x00\x80\x00\x00\x00\x00\x00'
-            b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
-            b'\x00\x00\x00\x2C\x00\x00\x00\x00'
-            b'\x02\x00\x01\x00\x00\x02\x02\x0C'
-            b'\x0A\x00\x3B'
-        )
         uploaded = SimpleUploadedFile(
             name='small.gif',
-            content=small_gif,
+            content=SMALL_GIF,
             content_type='image/gif'
         )
         cls.post = Post.objects.create(
@@ -239,13 +251,32 @@ class PostsViewsTests(TestCase):
     def test_cache_index_page(self):
         """Проверяем работу кеширования главной страницы"""
         response = self.authorized_client.get(reverse('posts:index'))
+        Post.objects.filter(pk=PostsViewsTests.post.pk).update(
+            text='Изменение в обход сигналов'
+        )
+        cached_response = self.authorized_client.get(reverse('posts:index'))
+        self.assertEqual(response.content, cached_response.content)
+
+    def test_new_post_invalidates_cached_pages(self):
+        """Новый пост сразу сбрасывает кэш страниц со списками"""
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list',
+                    kwargs={'slug': PostsViewsTests.group.slug}),
+            reverse('posts:profile',
+                    kwargs={'username': PostsViewsTests.author_user}),
+        )
+        for url in urls:
+            self.authorized_client.get(url)
         Post.objects.create(
-            text='Пост, который появится не сразу',
-            pub_date='Дата, которая тоже появится не сразу',
+            text='Пост, который появится сразу',
             author=PostsViewsTests.author_user,
+            group=PostsViewsTests.group,
         )
-        update_response = self.authorized_client.get(reverse('posts:index'))
-        self.assertEqual(response.content, update_response.content)
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.authorized_client.get(url)
+                self.assertContains(response, 'Пост, который появится сразу')
 
     def test_autherised_can_follow(self):
         """Проверяем возможность подписки авторизованного пользователя"""
@@ -325,6 +356,51 @@ class PostsViewsTests(TestCase):
             unfollowed_author_post not in response.context['page_obj']
         )
 
+    def test_new_post_added_to_followers_feed(self):
+        """Новый пост автора сразу попадает в ленты подписчиков"""
+        Follow.objects.create(
+            user=PostsViewsTests.follower_user,
+            author=PostsViewsTests.author_user,
+        )
+        new_post = Post.objects.create(
+            text='Пост после подписки',
+            author=PostsViewsTests.author_user,
+        )
+        self.assertTrue(
+            FeedEntry.objects.filter(
+                user=PostsViewsTests.follower_user,
+                post=new_post,
+            ).exists()
+        )
+        response = self.authorized_client2.get(
+            reverse('posts:follow_index')
+        )
+        self.assertEqual(response.context['page_obj'][0], new_post)
+
+    def test_unfollow_trims_feed(self):
+        """После отписки посты автора пропадают из ленты"""
+        self.authorized_client2.get(
+            reverse(
+                'posts:profile_follow',
+                kwargs={'username': PostsViewsTests.author_user}
+            )
+        )
+        self.authorized_client2.get(
+            reverse(
+                'posts:profile_unfollow',
+                kwargs={'username': PostsViewsTests.author_user}
+            )
+        )
+        self.assertFalse(
+            FeedEntry.objects.filter(
+                user=PostsViewsTests.follower_user
+            ).exists()
+        )
+        response = self.authorized_client2.get(
+            reverse('posts:follow_index')
+        )
+        self.assertTrue(self.post not in response.context['page_obj'])
+
 
 class PaginatorViewsTest(TestCase):
     @classmethod
@@ -384,3 +460,664 @@ class PaginatorViewsTest(TestCase):
         self.page_contain_ten_records(
             response=response
         )
+
+    def test_total_from_counters(self):
+        """Общее число постов берётся из счётчиков, сотрудникам — точное"""
+        # bulk_create в setUpClass не вызывает сигналы счётчиков.
+        rebuild_post_counters()
+        Post.objects.create(
+            text='Ещё пост',
+            author=PaginatorViewsTest.author_user,
+            group=PaginatorViewsTest.group,
+        )
+        index = reverse('posts:index')
+        group = reverse(
+            'posts:group_list', kwargs={'slug': PaginatorViewsTest.group.slug}
+        )
+        self.assertContains(self.guest_client.get(index), 'Всего записей: 11')
+        self.assertContains(self.guest_client.get(group), 'Всего записей: 11')
+        PostCounter.objects.filter(scope='all').update(posts_count=100)
+        cache.clear()
+        self.assertContains(
+            self.guest_client.get(index), 'Всего записей: 100'
+        )
+        staff = User.objects.create_user(username='staff', is_staff=True)
+        staff_client = Client()
+        staff_client.force_login(staff)
+        self.assertContains(staff_client.get(index), 'Всего записей: 11')
+
+    def test_cursor_pages_walk_forward_and_back(self):
+        """Курсоры листают записи без пропусков и повторов"""
+        for i in range(3):
+            Post.objects.create(
+                text=f'Дополнительный пост {i}',
+                author=PaginatorViewsTest.author_user,
+            )
+        url = reverse('posts:index')
+        first_page = self.guest_client.get(url).context['page_obj']
+        self.assertIsNone(first_page.previous_cursor)
+        cache.clear()
+        second_page = self.guest_client.get(
+            url, {'after': first_page.next_cursor}
+        ).context['page_obj']
+        self.assertEqual(len(second_page), 3)
+        self.assertIsNone(second_page.next_cursor)
+        self.assertFalse(set(first_page) & set(second_page))
+        cache.clear()
+        back_page = self.guest_client.get(
+            url, {'before': second_page.previous_cursor}
+        ).context['page_obj']
+        self.assertEqual(list(back_page), list(first_page))
+
+    def test_page_number_redirects_to_cursor(self):
+        """Старые адреса ?page=N перенаправляются на курсор"""
+        Post.objects.create(
+            text='Пост на второй странице',
+            author=PaginatorViewsTest.author_user,
+        )
+        url = reverse('posts:profile',
+                      kwargs={'username': PaginatorViewsTest.author_user})
+        first_page = self.guest_client.get(url).context['page_obj']
+        response = self.guest_client.get(url, {'page': 2})
+        self.assertRedirects(
+            response, f'{url}?after={first_page.next_cursor}'
+        )
+        response = self.guest_client.get(url, {'page': 1})
+        self.assertRedirects(response, url)
+
+    def test_page_number_cursor_cached(self):
+        """Курсор для ?page=N ищется один раз, глубокие — на первую"""
+        Post.objects.create(
+            text='Пост на второй странице',
+            author=PaginatorViewsTest.author_user,
+        )
+        url = reverse('posts:index')
+        first = self.guest_client.get(url, {'page': 2})
+        with mock.patch(
+            'posts.views.CursorPaginator.cursor_for_number'
+        ) as cursor_for_number:
+            second = self.guest_client.get(url, {'page': 2})
+            deep = self.guest_client.get(url, {'page': 5000})
+        cursor_for_number.assert_not_called()
+        self.assertIn('after=', first['Location'])
+        self.assertEqual(second['Location'], first['Location'])
+        self.assertRedirects(deep, url, status_code=301)
+
+    def test_cursor_links_keep_query(self):
+        """Ссылки на соседние страницы сохраняют параметры запроса"""
+        Post.objects.create(
+            text='Пост на второй странице',
+            author=PaginatorViewsTest.author_user,
+        )
+        response = self.guest_client.get(
+            reverse('posts:index'), {'utm': 'feed'}
+        )
+        next_cursor = response.context['page_obj'].next_cursor
+        self.assertContains(
+            response, f'?utm=feed&amp;after={next_cursor}'
+        )
+
+    def test_broken_cursor_shows_first_page(self):
+        """Испорченный курсор открывает первую страницу"""
+        response = self.guest_client.get(
+            reverse('posts:group_list',
+                    kwargs={'slug': PaginatorViewsTest.group.slug}),
+            {'after': 'not-a-cursor'}
+        )
+        self.page_contain_ten_records(response=response)
+
+
+class SearchViewsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author_user = User.objects.create_user(username='hasNoName')
+        cls.cat_post = Post.objects.create(
+            text='Кот спит на подоконнике',
+            author=SearchViewsTest.author_user,
+        )
+        cls.dog_post = Post.objects.create(
+            text='Собака гуляет во дворе',
+            author=SearchViewsTest.author_user,
+        )
+
+    def setUp(self):
+        self.guest_client = Client()
+
+    def search(self, query, **params):
+        return self.guest_client.get(
+            reverse('posts:search'), {'q': query, **params}
+        ).context['page_obj']
+
+    def test_search_finds_posts_by_words(self):
+        """Поиск находит посты по словам и их началу"""
+        self.assertEqual(list(self.search('кот')), [self.cat_post])
+        self.assertEqual(list(self.search('соба двор')), [self.dog_post])
+        self.assertEqual(list(self.search('"OR* -(')), [])
+
+    def test_search_punctuation_only(self):
+        """Запрос из одних знаков препинания ничего не находит"""
+        for query in ('!!!', '+'):
+            with self.subTest(query=query):
+                response = self.guest_client.get(
+                    reverse('posts:search'), {'q': query}
+                )
+                self.assertEqual(response.status_code, 200)
+                self.assertIsNone(response.context['page_obj'])
+                self.assertContains(response, 'Ничего не найдено.')
+
+    def test_search_index_follows_edits(self):
+        """Индекс поиска обновляется при изменении и удалении постов"""
+        Post.objects.filter(pk=self.dog_post.pk).update(text='Кот и собака')
+        self.assertEqual(
+            set(self.search('кот')), {self.cat_post, self.dog_post}
+        )
+        self.cat_post.delete()
+        self.assertEqual(list(self.search('кот')), [self.dog_post])
+
+    def test_search_pagination(self):
+        """Результаты поиска листаются курсором"""
+        for i in range(POSTS_PER_PAGE):
+            Post.objects.create(
+                text=f'Кот номер {i}',
+                author=SearchViewsTest.author_user,
+            )
+        first_page = self.search('кот')
+        self.assertEqual(len(first_page), POSTS_PER_PAGE)
+        second_page = self.search('кот', after=first_page.next_cursor)
+        self.assertEqual(len(second_page), 1)
+        self.assertFalse(set(first_page) & set(second_page))
+        back_page = self.search('кот', before=second_page.previous_cursor)
+        self.assertEqual(list(back_page), list(first_page))
+
+    def test_admin_search_uses_index(self):
+        """Поиск в админке идёт через тот же индекс"""
+        post_admin = admin.site._registry[Post]
+        queryset, _ = post_admin.get_search_results(
+            None, Post.objects.all(), 'подоконн'
+        )
+        self.assertEqual(list(queryset), [self.cat_post])
+
+
+class PageCacheTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        Post.objects.create(text='Первый пост', author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        page_cache.stats.reset()
+        self.url = reverse('posts:index')
+
+    def test_stale_copy_while_refreshing(self):
+        """Пока страницу пересчитывает другой запрос, отдаётся старая копия"""
+        self.assertEqual(self.client.get(self.url)['X-Cache'], 'miss')
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Cache'], 'hit')
+        key = page_cache._page_key('index_page', response.wsgi_request)
+        Post.objects.create(text='Второй пост', author=PageCacheTest.author)
+        cache.add(f'{key}:lock', 1)
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Cache'], 'stale')
+        self.assertIn('no-store', response['Cache-Control'])
+        self.assertNotContains(response, 'Второй пост')
+        cache.delete(f'{key}:lock')
+        Post.objects.create(text='Третий пост', author=PageCacheTest.author)
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Cache'], 'miss')
+        self.assertContains(response, 'Третий пост')
+
+    def test_early_refresh(self):
+        """Запись обновляется заранее тем вероятнее, чем ближе срок"""
+        entry = page_cache.CachedPage(None, '', 1, expires=100, delta=1)
+        with mock.patch.object(page_cache.random, 'random', return_value=0):
+            self.assertFalse(entry.should_refresh(now=99))
+        with mock.patch.object(
+            page_cache.random, 'random', return_value=0.9
+        ):
+            self.assertTrue(entry.should_refresh(now=99))
+            self.assertFalse(entry.should_refresh(now=90))
+
+    def test_stats(self):
+        """Счётчики кэша учитывают попадания и промахи всех запросов"""
+        for _ in range(3):
+            self.client.get(self.url)
+        self.assertEqual(
+            page_cache.stats.totals(),
+            {'hit': 2, 'miss': 1, 'stale': 0, 'refresh': 0},
+        )
+        output = StringIO()
+        call_command('page_cache_stats', stdout=output)
+        self.assertIn('Попаданий: 2', output.getvalue())
+
+
+class ConditionalGetTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(
+            title='Группа', slug='conditional', description='Описание'
+        )
+        cls.post = Post.objects.create(
+            text='Пост', author=cls.author, group=cls.group
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(ConditionalGetTest.author)
+
+    def assertNotModified(self, url):
+        etag = self.client.get(url)['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.templates, [])
+        return etag
+
+    def test_post_detail_not_modified(self):
+        """Страница поста отвечает 304, пока не появится комментарий"""
+        url = reverse(
+            'posts:post_detail',
+            kwargs={'post_id': ConditionalGetTest.post.pk}
+        )
+        etag = self.assertNotModified(url)
+        Comment.objects.create(
+            post=ConditionalGetTest.post,
+            author=ConditionalGetTest.author,
+            text='Комментарий',
+        )
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Комментарий')
+
+    def test_post_version_read_once(self):
+        """Версия поста читается один раз на ETag и ключ кэша"""
+        url = reverse(
+            'posts:post_detail',
+            kwargs={'post_id': ConditionalGetTest.post.pk}
+        )
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response['X-Cache'], 'hit')
+        self.assertEqual(
+            sum('"version"' in query['sql'] for query in queries), 1
+        )
+
+    def test_lists_not_modified(self):
+        """Страницы со списками отвечают 304 до следующей записи"""
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list',
+                    kwargs={'slug': ConditionalGetTest.group.slug}),
+            reverse('posts:profile',
+                    kwargs={'username': ConditionalGetTest.author}),
+        )
+        etags = {url: self.assertNotModified(url) for url in urls}
+        Post.objects.create(
+            text='Новый пост',
+            author=ConditionalGetTest.author,
+            group=ConditionalGetTest.group,
+        )
+        for url, etag in etags.items():
+            with self.subTest(url=url):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertContains(response, 'Новый пост')
+
+    def test_etag_depends_on_user(self):
+        """Разные пользователи получают разные ETag"""
+        url = reverse('posts:index')
+        etag = self.client.get(url)['ETag']
+        response = Client().get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+
+class PostCardsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(
+            username='author', first_name='Лев', last_name='Толстой'
+        )
+        cls.group = Group.objects.create(
+            title='Группа', slug='cards', description='Описание'
+        )
+        cls.post = Post.objects.create(
+            text='Исходный текст', author=cls.author, group=cls.group
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.url = reverse('posts:index')
+
+    def get_as(self, username):
+        client = Client()
+        client.force_login(User.objects.get_or_create(username=username)[0])
+        return client.get(self.url)
+
+    def test_cards_shared_between_users(self):
+        """Карточка, отрисованная для одного пользователя, нужна и другим"""
+        self.get_as('first')
+        post = Post.objects.get(pk=PostCardsTest.post.pk)
+        self.assertIsNotNone(cache.get(card_key(post)))
+        Post.objects.filter(pk=post.pk).update(text='Текст в обход сигналов')
+        self.assertContains(self.get_as('second'), 'Исходный текст')
+
+    def test_cards_follow_group(self):
+        """Карточки обновляются при изменении группы"""
+        self.get_as('reader')
+        group = Group.objects.get(pk=PostCardsTest.group.pk)
+        group.slug = 'renamed'
+        group.save()
+        self.assertContains(
+            self.get_as('reader'),
+            reverse('posts:group_list', kwargs={'slug': 'renamed'})
+        )
+
+    def test_cards_follow_group_deletion(self):
+        """Карточки не ссылаются на удалённую группу"""
+        group_url = reverse(
+            'posts:group_list', kwargs={'slug': PostCardsTest.group.slug}
+        )
+        self.assertContains(self.get_as('reader'), group_url)
+        Group.objects.filter(pk=PostCardsTest.group.pk).delete()
+        self.assertNotContains(self.get_as('reader'), group_url)
+
+    def test_cards_follow_author_name(self):
+        """Карточки обновляются при смене имени автора"""
+        self.get_as('reader')
+        author = User.objects.get(pk=PostCardsTest.author.pk)
+        author.first_name = 'Николай'
+        author.save()
+        self.assertContains(self.get_as('reader'), 'Николай Толстой')
+
+    def test_cards_kept_on_other_author_changes(self):
+        """Правка автора, не видная в карточках, не меняет версию постов"""
+        version = Post.objects.get(pk=PostCardsTest.post.pk).version
+        author = User.objects.get(pk=PostCardsTest.author.pk)
+        author.email = 'leo@example.com'
+        author.save()
+        self.assertEqual(
+            Post.objects.get(pk=PostCardsTest.post.pk).version, version
+        )
+
+
+class HolePunchTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.stranger = User.objects.create_user(username='stranger')
+        cls.post = Post.objects.create(text='Общий пост', author=cls.author)
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+
+    def get_as(self, url, user=None):
+        client = Client()
+        if user is not None:
+            client.force_login(user)
+        return client.get(url)
+
+    def test_shell_shared_between_users(self):
+        """Оболочку страницы получают все, шапка своя у каждого"""
+        url = reverse('posts:index')
+        response = self.get_as(url)
+        self.assertEqual(response['X-Cache'], 'miss')
+        self.assertContains(response, 'Войти')
+        response = self.get_as(url, HolePunchTest.reader)
+        self.assertEqual(response['X-Cache'], 'hit')
+        self.assertContains(response, 'Пользователь: reader')
+        self.assertContains(response, 'Избранные авторы')
+        self.assertNotContains(response, 'Войти')
+        self.assertNotContains(response, '<!--hole:')
+
+    def test_follow_button_per_user(self):
+        """Кнопка подписки зависит от того, кто смотрит профиль"""
+        url = reverse('posts:profile', kwargs={'username': 'author'})
+        cases = (
+            (HolePunchTest.reader, 'Отписаться', 'Подписаться'),
+            (HolePunchTest.stranger, 'Подписаться', 'Отписаться'),
+        )
+        self.get_as(url, HolePunchTest.author)
+        for user, shown, hidden in cases:
+            with self.subTest(user=user.username):
+                response = self.get_as(url, user)
+                self.assertEqual(response['X-Cache'], 'hit')
+                self.assertContains(response, shown)
+                self.assertNotContains(response, hidden)
+        response = self.get_as(url, HolePunchTest.author)
+        self.assertNotContains(response, 'Подписаться')
+        self.assertNotContains(response, 'Отписаться')
+
+    def test_post_detail_comment_form(self):
+        """Страница поста кэшируется, форма комментария только для своих"""
+        url = reverse(
+            'posts:post_detail', kwargs={'post_id': HolePunchTest.post.pk}
+        )
+        self.assertNotContains(self.get_as(url), 'Добавить комментарий')
+        response = self.get_as(url, HolePunchTest.reader)
+        self.assertEqual(response['X-Cache'], 'hit')
+        self.assertContains(response, 'Добавить комментарий')
+        self.assertContains(response, 'csrfmiddlewaretoken')
+        Comment.objects.create(
+            post=HolePunchTest.post, author=HolePunchTest.reader,
+            text='Свежий комментарий',
+        )
+        response = self.get_as(url, HolePunchTest.reader)
+        self.assertEqual(response['X-Cache'], 'miss')
+        self.assertContains(response, 'Свежий комментарий')
+
+    def test_foreign_marks_not_filled(self):
+        """Метки с чужим nonce остаются как есть"""
+        request = self.get_as(reverse('posts:index')).wsgi_request
+        text = placeholder('other', 'header_user', {})
+        self.assertEqual(fill_holes(text, 'own', request), text)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ThumbnailTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.post = Post.objects.create(
+            text='Пост с картинкой',
+            author=ThumbnailTest.author,
+            image=SimpleUploadedFile(
+                name='thumb.gif', content=SMALL_GIF, content_type='image/gif'
+            ),
+        )
+        self.url = reverse(
+            'posts:post_detail', kwargs={'post_id': self.post.pk}
+        )
+
+    def test_original_until_ready(self):
+        """Пока миниатюры готовятся, показывается исходная картинка"""
+        self.assertTrue(is_pending(self.post.image.name))
+        response = self.client.get(self.url)
+        self.assertContains(response, f'src="{self.post.image.url}"')
+        self.assertContains(response, 'width="2" height="1"')
+
+    def test_dimensions_stored_on_upload(self):
+        """Размеры картинки сохраняются в посте при загрузке"""
+        post = Post.objects.get(pk=self.post.pk)
+        self.assertEqual((post.image_width, post.image_height), (2, 1))
+
+    def test_backfill_image_dimensions_command(self):
+        """Команда заполняет размеры уже загруженных картинок"""
+        Post.objects.create(
+            text='Картинка потерялась',
+            author=ThumbnailTest.author,
+            image='posts/missing.gif',
+        )
+        Post.objects.update(image_width=None, image_height=None)
+        index = reverse('posts:index')
+        self.assertNotContains(self.client.get(index), 'width="2"')
+        version = Post.objects.get(pk=self.post.pk).version
+        output = StringIO()
+        call_command('backfill_image_dimensions', stdout=output)
+        self.assertIn(
+            'Заполнено постов: 1, картинок не найдено: 1', output.getvalue()
+        )
+        post = Post.objects.get(pk=self.post.pk)
+        self.assertEqual((post.image_width, post.image_height), (2, 1))
+        self.assertEqual(post.version, version + 1)
+        self.assertContains(
+            self.client.get(index), 'width="2" height="1"'
+        )
+
+    def test_variants_after_generation(self):
+        """Готовые варианты картинки сбрасывают кэш страницы поста"""
+        self.client.get(self.url)
+        generate(self.post.image.name)
+        self.assertFalse(is_pending(self.post.image.name))
+        variant = self.post.image_variants.get()
+        self.assertEqual((variant.width, variant.height), (2, 1))
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Cache'], 'miss')
+        self.assertNotContains(response, f'src="{self.post.image.url}"')
+        self.assertContains(response, f'srcset="{variant.image.url} 2w"')
+
+    def test_generation_failure_logged(self):
+        """Сбой после создания вариантов пишется в лог, отметка снимается"""
+        with mock.patch(
+            'posts.thumbnails.bump_generation', side_effect=RuntimeError
+        ), self.assertLogs('posts.thumbnails', 'ERROR'):
+            generate(self.post.image.name)
+        self.assertFalse(is_pending(self.post.image.name))
+
+    @override_settings(THUMBNAIL_WORKERS=1)
+    def test_workers_use_current_database_and_media(self):
+        """Воркерам передаются база, MEDIA_ROOT и кэши текущего процесса"""
+        with mock.patch.object(thumbnails, '_executor', None), \
+                mock.patch.object(thumbnails, '_executor_config', None), \
+                mock.patch.object(thumbnails, 'ProcessPoolExecutor') as pool:
+            thumbnails._submit(self.post.image.name)
+        initargs = pool.call_args[1]['initargs']
+        self.assertEqual(initargs, (
+            settings.SETTINGS_MODULE,
+            connection.settings_dict['NAME'],
+            TEMP_MEDIA_ROOT,
+            settings.CACHES,
+        ))
+        submitted = pool.return_value.submit
+        submitted.assert_called_once_with(generate, self.post.image.name)
+        submitted.return_value.add_done_callback.assert_called_once_with(
+            thumbnails._log_failure
+        )
+
+    def test_variant_widths_never_upscale(self):
+        """Варианты не шире исходной картинки и её кадра"""
+        cases = {
+            (1200, 800): [320, 640, 960],
+            (700, 700): [320, 640],
+            (1000, 200): [320],
+            (200, 200): [200],
+        }
+        for size, widths in cases.items():
+            with self.subTest(size=size):
+                self.assertEqual(variant_widths(*size), widths)
+
+    def test_build_image_variants_command(self):
+        """Команда создаёт варианты картинок, у которых их нет"""
+        output = StringIO()
+        call_command('build_image_variants', stdout=output)
+        self.assertIn('Обработано картинок: 1', output.getvalue())
+        self.assertTrue(self.post.image_variants.exists())
+        call_command('build_image_variants', stdout=output)
+        self.assertIn('Обработано картинок: 0', output.getvalue())
+
+    def test_build_image_variants_bumps_generation_once(self):
+        """Команда сбрасывает кэш страниц один раз, а не на каждую картинку"""
+        buffer = BytesIO()
+        Image.new('RGB', (4, 3)).save(buffer, 'PNG')
+        Post.objects.create(
+            text='Вторая картинка', author=self.post.author,
+            image=SimpleUploadedFile('other.png', buffer.getvalue()),
+        )
+        command = 'posts.management.commands.build_image_variants'
+        with mock.patch('posts.thumbnails.bump_generation') as per_image, \
+                mock.patch(f'{command}.bump_generation') as per_run:
+            call_command('build_image_variants', '--all', stdout=StringIO())
+        per_image.assert_not_called()
+        per_run.assert_called_once_with()
+
+    def test_build_image_variants_all_renders_again(self):
+        """С --all варианты пересоздаются, а не копируются у дубликатов"""
+        generate(self.post.image.name)
+        old = set(self.post.image_variants.values_list('pk', flat=True))
+        with mock.patch(
+            'posts.variants.render_variants',
+            wraps=variants.render_variants,
+        ) as render:
+            call_command('build_image_variants', '--all', stdout=StringIO())
+        render.assert_called_once_with(self.post.image.name)
+        new = set(self.post.image_variants.values_list('pk', flat=True))
+        self.assertTrue(new)
+        self.assertFalse(old & new)
+
+    def test_text_edit_keeps_thumbnails(self):
+        """Правка текста без новой картинки не ставит миниатюры в очередь"""
+        generate(self.post.image.name)
+        post = Post.objects.get(pk=self.post.pk)
+        post.text = 'Новый текст'
+        post.save()
+        self.assertFalse(is_pending(post.image.name))
+
+    def test_thumbnails_resolved_in_bulk(self):
+        """Готовые миниатюры находятся одним запросом без тега на картинку"""
+        thumbnail = get_thumbnail(
+            self.post.image, FALLBACK_GEOMETRY, **FALLBACK_OPTIONS
+        )
+        cache.clear()
+        with self.assertNumQueries(1):
+            ready = resolve_thumbnails(
+                [self.post.image], FALLBACK_GEOMETRY, **FALLBACK_OPTIONS
+            )
+        self.assertEqual(ready[self.post.image.name].url, thumbnail.url)
+        with mock.patch(
+            'sorl.thumbnail.templatetags.thumbnail.get_thumbnail'
+        ) as tag_lookup:
+            response = self.client.get(reverse('posts:index'))
+        tag_lookup.assert_not_called()
+        self.assertContains(response, f'src="{thumbnail.url}"')
+
+    def test_thumbnail_keys_match_sorl(self):
+        """Ключи миниатюр совпадают с sorl-thumbnail для всех форматов"""
+        formats = ('JPEG', 'PNG', 'GIF', 'WEBP')
+        for preserve, image_format in product((False, True), formats):
+            with self.subTest(preserve=preserve, image_format=image_format):
+                if image_format == 'WEBP' and not features.check('webp'):
+                    self.skipTest('Pillow собран без поддержки WebP')
+                buffer = BytesIO()
+                Image.new('RGB', (4, 3)).save(buffer, image_format)
+                post = Post.objects.create(
+                    text=f'Картинка {image_format}',
+                    author=ThumbnailTest.author,
+                    image=SimpleUploadedFile(
+                        f'image.{image_format.lower()}', buffer.getvalue()
+                    ),
+                )
+                with override_settings(THUMBNAIL_PRESERVE_FORMAT=preserve):
+                    thumbnail = get_thumbnail(
+                        post.image, FALLBACK_GEOMETRY, **FALLBACK_OPTIONS
+                    )
+                    cache.clear()
+                    ready = resolve_thumbnails(
+                        [post.image], FALLBACK_GEOMETRY, **FALLBACK_OPTIONS
+                    )
+                self.assertEqual(ready[post.image.name].url, thumbnail.url)
@@ -0,0 +1,182 @@
+"""Уменьшенные копии картинок постов, подготовленные заранее.
+
+После сохранения поста с новой картинкой её варианты для `srcset`
+(см. `posts.variants`) создаются в отдельных процессах, а не первым
+посетителем страницы. Пока они не готовы, шаблоны показывают исходную
+картинку, а когда готовы — версия поста увеличивается и закэшированные
+карточки и страницы перерисовываются.
+"""
+import hashlib
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import F
+from sorl.thumbnail import default
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import (EMPTY_VALUE,
+                                                       KVStore)
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from . import worker
+from .cache import bump_generation
+from .models import Post
+from .variants import build_variants
+
+# Если воркер не справился, через это время страницы сами создадут
+# миниатюру, как без предварительной подготовки.
+PENDING_TIMEOUT = 60 * 10
+# Миниатюра sorl-thumbnail для постов без вариантов; те же параметры
+# записаны в шаблоне posts/includes/post_image.html.
+FALLBACK_GEOMETRY = '960x339'
+FALLBACK_OPTIONS = {'crop': 'center', 'upscale': True}
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_config = None
+
+
+def _pending_key(name):
+    digest = hashlib.md5(name.encode('utf-8')).hexdigest()
+    return f'posts:thumbnail:pending:{digest}'
+
+
+def is_pending(name):
+    return bool(name) and cache.get(_pending_key(name)) is not None
+
+
+def pending_names(names):
+    """Те из `names`, чьи копии ещё готовятся, одним `get_many`."""
+    keys = {_pending_key(name): name for name in names}
+    return {keys[key] for key in cache.get_many(list(keys))}
+
+
+class StoredImage:
+    """Исходная картинка поста с размерами из базы, а не из файла."""
+
+    def __init__(self, file_):
+        self.url = file_.url
+        self.width = file_.instance.image_width
+        self.height = file_.instance.image_height
+
+
+def _thumbnail_options(source, options):
+    # Те же умолчания, что добавляет ThumbnailBackend.get_thumbnail:
+    # от них зависит имя миниатюры. Закрытые методы бэкенда — причина,
+    # по которой версия sorl-thumbnail закреплена в requirements.txt.
+    backend = default.backend
+    options = dict(options)
+    if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+        options.setdefault('format', backend._get_format(source))
+    for key, value in backend.default_options.items():
+        options.setdefault(key, value)
+    for key, attr in backend.extra_options:
+        value = getattr(sorl_settings, attr)
+        if value != getattr(sorl_defaults, attr):
+            options.setdefault(key, value)
+    return options
+
+
+def resolve_thumbnails(files, geometry, **options):
+    """Готовые миниатюры sorl-thumbnail для `files` разом.
+
+    Вместо обращения к хранилищу ключей на каждый тег `thumbnail`
+    ключи читаются одним `get_many`, а не найденные в кэше — одним
+    SQL-запросом. Возвращает словарь имя файла → миниатюра; картинки
+    без готовых миниатюр в него не попадают, их создаст тег.
+    """
+    if not files or not isinstance(default.kvstore, KVStore):
+        return {}
+    keys = {}
+    for file_ in files:
+        source = ImageFile(file_)
+        name = default.backend._get_thumbnail_filename(
+            source, geometry, _thumbnail_options(source, options)
+        )
+        keys[add_prefix(ImageFile(name, default.storage).key)] = file_.name
+    kv_cache = default.kvstore.cache
+    values = kv_cache.get_many(list(keys))
+    missing = [key for key in keys if key not in values]
+    if missing:
+        stored = dict(KVStoreModel.objects.filter(
+            key__in=missing
+        ).values_list('key', 'value'))
+        kv_cache.set_many(stored, sorl_settings.THUMBNAIL_CACHE_TIMEOUT)
+        values.update(stored)
+    return {
+        keys[key]: deserialize_image_file(value)
+        for key, value in values.items() if value != EMPTY_VALUE
+    }
+
+
+def generate(name, reuse=True, invalidate_pages=True):
+    """Создаёт варианты картинки и обновляет посты с ней.
+
+    С `invalidate_pages=False` кэш страниц не сбрасывается: так делает
+    команда, обрабатывающая много картинок, — один раз в конце.
+    """
+    try:
+        build_variants(name, reuse)
+        Post.objects.filter(image=name).update(version=F('version') + 1)
+        if invalidate_pages:
+            bump_generation()
+    except Exception:
+        logger.exception('Не удалось создать варианты %s', name)
+    finally:
+        cache.delete(_pending_key(name))
+
+
+def _get_executor():
+    global _executor, _executor_config
+    config = (
+        os.getpid(),
+        settings.SETTINGS_MODULE,
+        connection.settings_dict['NAME'],
+        settings.MEDIA_ROOT,
+        settings.CACHES,
+    )
+    # Пул нельзя унаследовать через fork: у дочернего процесса он свой.
+    if _executor_config != config:
+        if _executor is not None and _executor_config[0] == config[0]:
+            _executor.shutdown(wait=False)
+        # spawn, а не fork: воркер не наследует соединения с базой
+        # и потоки веб-сервера.
+        _executor = ProcessPoolExecutor(
+            max_workers=settings.THUMBNAIL_WORKERS,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=worker.setup,
+            initargs=config[1:],
+        )
+        _executor_config = config
+    return _executor
+
+
+def _log_failure(future):
+    # Ошибки самого generate он пишет в лог сам; здесь — сбои пула,
+    # например упавший воркер.
+    if future.cancelled():
+        return
+    error = future.exception()
+    if error is not None:
+        logger.error('Воркер миниатюр завершился с ошибкой', exc_info=error)
+
+
+def _submit(name):
+    if not settings.THUMBNAIL_WORKERS:
+        generate(name)
+        return
+    _get_executor().submit(generate, name).add_done_callback(_log_failure)
+
+
+def queue_thumbnails(name):
+    """Ставит создание вариантов `name` в очередь после коммита."""
+    cache.set(_pending_key(name), 1, PENDING_TIMEOUT)
+    transaction.on_commit(lambda: _submit(name))
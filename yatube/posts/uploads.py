@@ -0,0 +1,141 @@
+"""Обработчики загрузки картинок: хеш, ограничение размера и проверка.
+
+Файл пишется во временный файл (или в память, если он маленький) по
+мере получения, и одновременно считается его SHA-256 — он нужен
+`posts.storage.ContentAddressedStorage` для имени файла. Когда файл
+превышает `IMAGE_UPLOAD_MAX_SIZE`, остаток не сохраняется. По
+заголовку картинки, без декодирования пикселей, проверяются формат
+и число пикселей.
+
+Отклонённый файл попадает в `request.FILES` как `RejectedUpload`, и
+форма показывает причину отказа (см. `PostForm`). Обработчики
+подключаются только к формам постов декоратором `bounded_uploads`.
+"""
+import hashlib
+from functools import wraps
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import (MemoryFileUploadHandler,
+                                             TemporaryFileUploadHandler)
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+from PIL import Image
+
+NOT_AN_IMAGE = 'Файл не является картинкой'
+
+
+class RejectedUpload(UploadedFile):
+    """Загрузка, отклонённая до декодирования; `error` — причина."""
+
+    def __init__(self, name, content_type, size, error):
+        super().__init__(BytesIO(), name, content_type, size)
+        self.error = error
+
+
+def check_image(file):
+    """Причина отказа по заголовку картинки или None."""
+    try:
+        # Image.open читает только заголовок: пиксели не декодируются.
+        with Image.open(file) as image:
+            image_format = image.format
+            width, height = image.size
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return NOT_AN_IMAGE
+    finally:
+        file.seek(0)
+    formats = settings.IMAGE_UPLOAD_FORMATS
+    if image_format not in formats:
+        return f'Допустимые форматы картинок: {", ".join(formats)}'
+    max_pixels = settings.IMAGE_UPLOAD_MAX_PIXELS
+    if width * height > max_pixels:
+        return (
+            f'Картинка {width}x{height} слишком большая: '
+            f'допускается не больше {max_pixels / 10 ** 6:g} Мпикс'
+        )
+    return None
+
+
+class BoundedUploadMixin:
+    def new_file(self, *args, **kwargs):
+        # До вызова родителя: MemoryFileUploadHandler, приняв файл,
+        # выходит из new_file исключением StopFutureHandlers.
+        self.hasher = hashlib.sha256()
+        self.received = 0
+        self.error = None
+        super().new_file(*args, **kwargs)
+
+    def accept(self, raw_data):
+        """Учитывает кусок файла; False, если файл уже отклонён."""
+        if self.error is not None:
+            return False
+        self.received += len(raw_data)
+        max_size = settings.IMAGE_UPLOAD_MAX_SIZE
+        if self.received > max_size:
+            self.error = f'Файл больше {max_size / 2 ** 20:g} МБ'
+            self.discard()
+            return False
+        self.hasher.update(raw_data)
+        return True
+
+    def discard(self):
+        pass
+
+    def file_complete(self, file_size):
+        if self.error is None:
+            file = super().file_complete(file_size)
+            self.error = check_image(file)
+            if self.error is None:
+                file.content_hash = self.hasher.hexdigest()
+                return file
+            self.discard()
+        return RejectedUpload(
+            self.file_name, self.content_type, self.received, self.error
+        )
+
+
+class BoundedMemoryFileUploadHandler(BoundedUploadMixin,
+                                     MemoryFileUploadHandler):
+    def receive_data_chunk(self, raw_data, start):
+        # Слишком большой для памяти файл примет следующий обработчик.
+        if not self.activated:
+            return raw_data
+        if self.accept(raw_data):
+            return super().receive_data_chunk(raw_data, start)
+        return None
+
+    def file_complete(self, file_size):
+        if not self.activated:
+            return None
+        return super().file_complete(file_size)
+
+
+class BoundedTemporaryFileUploadHandler(BoundedUploadMixin,
+                                        TemporaryFileUploadHandler):
+    def receive_data_chunk(self, raw_data, start):
+        if self.accept(raw_data):
+            return super().receive_data_chunk(raw_data, start)
+        return None
+
+    def discard(self):
+        # Временный файл удаляется при закрытии.
+        self.file.close()
+
+
+def bounded_uploads(view):
+    """Декоратор: загрузки во `view` принимают обработчики выше.
+
+    Обработчики надо заменить до чтения `request.POST`, а его читает
+    CsrfViewMiddleware, поэтому CSRF проверяется уже после замены.
+    """
+    protected = csrf_protect(view)
+
+    @csrf_exempt
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        request.upload_handlers = [
+            BoundedMemoryFileUploadHandler(request),
+            BoundedTemporaryFileUploadHandler(request),
+        ]
+        return protected(request, *args, **kwargs)
+    return wrapper
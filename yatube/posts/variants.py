@@ -0,0 +1,94 @@
+"""Картинки постов нескольких ширин для `srcset`.
+
+Вместо одной кадрированной копии 960x339, увеличенной при
+необходимости, сохраняются копии ширин `WIDTHS` (не больше исходной) в
+WebP, если Pillow собран с его поддержкой, и в JPEG. Браузер выбирает
+по `srcset` и `sizes` самую лёгкую подходящую копию.
+"""
+import os
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image, ImageOps, features
+
+from .models import Post, PostImageVariant
+
+WIDTHS = (320, 640, 960)
+# Пропорции кадра прежней миниатюры 960x339.
+ASPECT = 339 / 960
+QUALITY = 80
+ENCODERS = {
+    PostImageVariant.WEBP: ('WEBP', 'webp'),
+    PostImageVariant.JPEG: ('JPEG', 'jpg'),
+}
+FORMATS = tuple(
+    fmt for fmt, available in (
+        (PostImageVariant.WEBP, features.check('webp')),
+        (PostImageVariant.JPEG, True),
+    ) if available
+)
+
+
+def variant_widths(width, height):
+    """Ширины копий без увеличения исходной картинки."""
+    limit = min(width, int(height / ASPECT))
+    return [variant for variant in WIDTHS if variant <= limit] or [limit]
+
+
+def render_variants(name):
+    """Сохраняет копии картинки `name` в хранилище.
+
+    Возвращает список `(format, width, height, name)`.
+    """
+    with default_storage.open(name) as source:
+        image = Image.open(source)
+        image = image.convert('RGB')
+    stem = os.path.splitext(os.path.basename(name))[0]
+    variants = []
+    for width in variant_widths(image.width, image.height):
+        height = max(round(width * ASPECT), 1)
+        frame = ImageOps.fit(image, (width, height), Image.LANCZOS)
+        for fmt in FORMATS:
+            encoder, extension = ENCODERS[fmt]
+            buffer = BytesIO()
+            frame.save(buffer, encoder, quality=QUALITY)
+            saved = default_storage.save(
+                f'posts/variants/{stem}-{width}.{extension}',
+                ContentFile(buffer.getvalue()),
+            )
+            variants.append((fmt, width, height, saved))
+    return variants
+
+
+def build_variants(name, reuse=True):
+    """Заменяет варианты картинки у всех постов, где она используется.
+
+    С `reuse=False` варианты создаются заново, даже если они уже есть
+    у другого поста с той же картинкой.
+    """
+    posts = list(Post.objects.filter(image=name).values_list('pk', flat=True))
+    if not posts:
+        return 0
+    variants = None
+    if reuse:
+        # Файлы названы по содержимому: у дубликата уже загруженной
+        # картинки варианты берутся готовыми, без декодирования.
+        variants = list(PostImageVariant.objects.filter(
+            post__image=name
+        ).order_by().values_list(
+            'format', 'width', 'height', 'image'
+        ).distinct())
+    variants = variants or render_variants(name)
+    with transaction.atomic():
+        PostImageVariant.objects.filter(post__in=posts).delete()
+        PostImageVariant.objects.bulk_create([
+            PostImageVariant(
+                post_id=post_id, format=fmt, width=width, height=height,
+                image=saved,
+            )
+            for post_id in posts
+            for fmt, width, height, saved in variants
+        ])
+    return len(variants)
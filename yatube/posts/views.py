@@ -1,20 +1,31 @@
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
-from django.db import IntegrityError
+from django.db import IntegrityError, transaction
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse
-from django.views.decorators.cache import cache_page
+from django.views.decorators.http import condition
 
+from .cache import (PAGE_CACHE_TIMEOUT, cache_page_versioned,
+                    get_generation, list_etag, page_etag)
+from .counters import posts_total, user_counters
+from .feed import feed_entries
 from .forms import CommentForm, PostForm
 from .models import Follow, Group, Post, User
+from .paginators import (CURSOR_KEYS, MAX_PAGE_NUMBER, CursorPaginator,
+                         PageMoved, cached_count, follow_page_moves,
+                         page_cursor)
+from .search import SearchPaginator, match_expression, search_posts
+from .uploads import bounded_uploads
 
 POSTS_AMOUNT = 10
+FEED_CURSOR_KEYS = ('pub_date', 'post_id')
 
 
-@cache_page(20, key_prefix="index_page")
+@condition(etag_func=list_etag)
+@cache_page_versioned(PAGE_CACHE_TIMEOUT, key_prefix="index_page")
+@follow_page_moves
 def index(request):
-    posts = Post.objects.all()
-    page_obj = paginate_posts(request, posts)
+    posts = Post.objects.select_related('author', 'group')
+    page_obj = paginate_posts(request, posts, count=posts_total)
     template = 'posts/index.html'
 
     context = {
@@ -23,12 +34,17 @@ def index(request):
     return render(request, template, context)
 
 
+@condition(etag_func=list_etag)
+@cache_page_versioned(PAGE_CACHE_TIMEOUT, key_prefix="group_page")
+@follow_page_moves
 def group_posts(request, slug):
     template = 'posts/group_list.html'
 
     group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.all()
-    page_obj = paginate_posts(request, posts)
+    posts = group.posts.select_related('author', 'group')
+    page_obj = paginate_posts(
+        request, posts, count=lambda: posts_total(group.pk)
+    )
 
     context = {
         'group': group,
@@ -37,45 +53,124 @@ def group_posts(request, slug):
     return render(request, template, context)
 
 
+@condition(etag_func=list_etag)
+@cache_page_versioned(PAGE_CACHE_TIMEOUT, key_prefix="profile_page")
+@follow_page_moves
 def profile(request, username):
     template = 'posts/profile.html'
 
-    author = get_object_or_404(User, username=username)
-    posts = author.posts.all()
-    posts_amount = author.posts.count()
+    author = get_object_or_404(
+        User.objects.select_related('counters'), username=username
+    )
+    posts = author.posts.select_related('group')
+    counters = user_counters(author)
 
-    page_obj = paginate_posts(request, posts)
-    following = False
-    if request.user.is_authenticated:
-        following = (Follow.objects.filter(
-            user=request.user,
-            author=User.objects.filter(username=username)[0]).exists)
+    page_obj = paginate_posts(
+        request, posts, count=lambda: counters.posts_count
+    )
     context = {
         'page_obj': page_obj,
         'author': author,
-        'posts_amount': posts_amount,
-        'following': following,
+        'posts_amount': counters.posts_count,
+        'counters': counters,
     }
     return render(request, template, context)
 
 
-def paginate_posts(request, posts):
-    paginator = Paginator(posts, POSTS_AMOUNT)
+def paginate_posts(request, posts, keys=CURSOR_KEYS, count=None):
+    """Страница постов по курсору из `?after=`/`?before=`.
+
+    `count` — стратегия подсчёта общего числа постов; сотрудникам
+    всегда показывается точное число.
+    """
+    if request.user.is_staff:
+        count = None
+    paginator = CursorPaginator(posts, POSTS_AMOUNT, keys, count)
     page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    if page_number is not None:
+        query = request.GET.copy()
+        del query['page']
+        deep = False
+        if 'after' not in query and 'before' not in query:
+            try:
+                number = int(page_number)
+            except ValueError:
+                number = 1
+            deep = number > MAX_PAGE_NUMBER
+            cursor = None
+            if 1 < number <= MAX_PAGE_NUMBER:
+                cursor = page_cursor(paginator, number, get_generation())
+            if cursor:
+                query['after'] = cursor
+        url = request.path
+        if query:
+            url = f'{url}?{query.urlencode()}'
+        # Адрес первой страницы не меняется, поэтому перенаправление
+        # с глубокой страницы можно кэшировать навсегда.
+        raise PageMoved(url, permanent=deep)
+    page_obj = paginator.cursor_page(
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+    )
     return page_obj
 
 
+def search(request):
+    template = 'posts/search.html'
+
+    query = request.GET.get('q', '').strip()
+    page_obj = None
+    # В запросе из одних знаков препинания искать нечего.
+    if match_expression(query):
+        posts = search_posts(query).select_related('author', 'group')
+        paginator = SearchPaginator(
+            posts, POSTS_AMOUNT, count=cached_count(posts)
+        )
+        page_obj = paginator.cursor_page(
+            after=request.GET.get('after'),
+            before=request.GET.get('before'),
+        )
+
+    context = {
+        'query': query,
+        'page_obj': page_obj,
+    }
+    return render(request, template, context)
+
+
+def post_version(request, post_id):
+    # Нужна и для ETag, и для ключа кэша: читается раз за запрос.
+    versions = request.__dict__.setdefault('post_versions', {})
+    if post_id not in versions:
+        versions[post_id] = Post.objects.filter(pk=post_id).values_list(
+            'version', flat=True
+        ).first()
+    return versions[post_id]
+
+
+def post_etag(request, post_id):
+    version = post_version(request, post_id)
+    if version is None:
+        return None
+    return page_etag(request, version)
+
+
+@condition(etag_func=post_etag)
+@cache_page_versioned(
+    PAGE_CACHE_TIMEOUT, key_prefix="post_page", version=post_version
+)
 def post_detail(request, post_id):
     template = 'posts/post_detail.html'
 
-    post = get_object_or_404(Post, pk=post_id)
+    post = get_object_or_404(
+        Post.objects.select_related('author__counters', 'group'),
+        pk=post_id
+    )
     post_title = post.text[:30]
     post_pub_date = post.pub_date
     author = post.author
-    author_posts_amount = author.posts.all().count()
-    comment_form = CommentForm(request.POST or None)
-    post_comments = post.comments.all()
+    author_posts_amount = user_counters(author).posts_count
+    post_comments = post.comments.select_related('author')
 
     context = {
         "post": post,
@@ -83,14 +178,15 @@ def post_detail(request, post_id):
         "pub_date": post_pub_date,
         "author": author,
         "author_posts_amount": author_posts_amount,
-        "comment_form": comment_form,
         "comments": post_comments,
     }
 
     return render(request, template, context)
 
 
+@bounded_uploads
 @login_required
+@transaction.atomic
 def post_create(request):
 
     template = "posts/create_post.html"
@@ -111,6 +207,7 @@ def post_create(request):
     return render(request, template, context)
 
 
+@bounded_uploads
 @login_required
 def post_edit(request, post_id):
 
@@ -126,7 +223,7 @@ def post_edit(request, post_id):
     )
 
     if request.user == author:
-        if request.method == "POST" and form.is_valid:
+        if request.method == "POST" and form.is_valid():
             post = form.save()
             return redirect("posts:post_detail", post_id)
 
@@ -140,6 +237,7 @@ def post_edit(request, post_id):
 
 
 @login_required
+@transaction.atomic
 def add_comment(request, post_id):
     post = get_object_or_404(Post, pk=post_id)
     form = CommentForm(request.POST or None)
@@ -152,12 +250,13 @@ def add_comment(request, post_id):
 
 
 @login_required
+@follow_page_moves
 def follow_index(request):
-    authors = Follow.objects.filter(user=request.user)
-    posts = []
-    for note in authors:
-        posts.extend(Post.objects.filter(author=note.author))
-    page_obj = paginate_posts(request, posts)
+    entries = feed_entries(request.user)
+    page_obj = paginate_posts(
+        request, entries, FEED_CURSOR_KEYS, count=cached_count(entries)
+    )
+    page_obj.object_list = [entry.post for entry in page_obj.object_list]
     template = 'posts/follow.html'
 
     context = {
@@ -170,26 +269,22 @@ def follow_index(request):
 def profile_follow(request, username):
     redirect_page = reverse('posts:profile', kwargs={'username': username})
     try:
-        Follow.objects.create(
-            user=request.user,
-            author=User.objects.filter(username=username)[0]
-        )
+        with transaction.atomic():
+            Follow.objects.create(
+                user=request.user,
+                author=User.objects.filter(username=username)[0]
+            )
     except IntegrityError:
         return redirect(redirect_page)
     return redirect(redirect_page)
 
 
 @login_required
+@transaction.atomic
 def profile_unfollow(request, username):
     Follow.objects.filter(
         user=request.user,
         author=User.objects.filter(username=username)[0]
     ).delete()
-    print(
-        Follow.objects.filter(
-            user=request.user,
-            author=User.objects.filter(username=username)[0]
-        )
-    )
     redirect_page = reverse('posts:profile', kwargs={'username': username})
     return redirect(redirect_page)
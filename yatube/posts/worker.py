@@ -0,0 +1,20 @@
+"""Настройка процесса-воркера миниатюр (см. `posts.thumbnails`).
+
+Модуль не импортирует модели: его загружает только что запущенный
+процесс, в котором Django ещё не настроен.
+"""
+import os
+
+import django
+from django.conf import settings
+
+
+def setup(settings_module, database, media_root, caches):
+    # Воркер запускается через spawn и читает настройки заново: база,
+    # MEDIA_ROOT и кэши передаются явно, чтобы он работал с теми же,
+    # что и веб-процесс, даже если они изменены после запуска.
+    os.environ['DJANGO_SETTINGS_MODULE'] = settings_module
+    django.setup()
+    settings.DATABASES['default']['NAME'] = database
+    settings.MEDIA_ROOT = media_root
+    settings.CACHES = caches
@@ -45,6 +45,7 @@ INSTALLED_APPS = [
     'posts.apps.PostsConfig',
     'users.apps.UsersConfig',
     'core.apps.CoreConfig',
+    'api.apps.ApiConfig',
     'sorl.thumbnail',
 ]
 
@@ -91,12 +92,21 @@ DATABASES = {
     }
 }
 
+# Один файл на все процессы сервера: сброс кэша виден каждому воркеру.
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'core.cache.SQLiteCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache.sqlite3'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+            'MAX_SIZE': 256 * 2 ** 20,
+        },
     }
 }
 
+# Тесты пишут кэш во временный файл (см. core.test_runner).
+TEST_RUNNER = 'core.test_runner.TestRunner'
+
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
 
@@ -143,5 +153,13 @@ EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# Картинки постов проверяются по мере получения: хеш, размер, формат и
+# число пикселей по заголовку (posts.uploads.bounded_uploads).
+IMAGE_UPLOAD_MAX_SIZE = 10 * 2 ** 20
+IMAGE_UPLOAD_MAX_PIXELS = 40 * 10 ** 6
+IMAGE_UPLOAD_FORMATS = ('JPEG', 'PNG', 'GIF', 'WEBP')
+# Процессы, заранее создающие миниатюры. 0 — создавать сразу после
+# коммита в том же процессе; так делают только тесты (core.test_runner).
+THUMBNAIL_WORKERS = 2
 
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
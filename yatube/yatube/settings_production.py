@@ -0,0 +1,18 @@
+"""Настройки для боевого запуска на SQLite.
+
+DJANGO_SETTINGS_MODULE=yatube.settings_production
+"""
+from .settings import *  # noqa: F401,F403
+from .settings import DATABASES
+
+from core.db import PRODUCTION_PRAGMAS
+
+DEBUG = False
+
+# Соединение живёт между запросами, а не открывается на каждый.
+DATABASES['default']['CONN_MAX_AGE'] = 600
+# Сколько секунд ждать снятия блокировки, прежде чем вернуть
+# "database is locked".
+DATABASES['default']['OPTIONS'] = {'timeout': 5}
+
+SQLITE_PRAGMAS = PRODUCTION_PRAGMAS